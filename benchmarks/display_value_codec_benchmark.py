@@ -0,0 +1,117 @@
+"""Display Value Codec Benchmark
+
+Compares the cost of encoding and decoding LiveDbDisplayValueTuples, as a vortex
+Payload, which is how bulkLoadDeferredGenerator chunks are sent by default, and
+with the rows and columns encodings of LiveDbDisplayValueCodec.
+
+The vortex payload is encoded here, the default bulk load encodes it in PostgreSQL,
+the decode is the same.
+
+This doesn't need a database.
+
+Usage ::
+
+    python benchmarks/display_value_codec_benchmark.py --tuples 10000 --repeat 5
+
+"""
+import argparse
+import time
+
+from vortex.Payload import Payload
+
+from peek_plugin_livedb.tuples.LiveDbDisplayValueCodec import (
+    decodeDisplayValueColumns,
+    decodeDisplayValueRows,
+    decodeDisplayValueTuples,
+    encodeDisplayValueColumns,
+    encodeDisplayValueTuples,
+)
+from peek_plugin_livedb.tuples.LiveDbDisplayValueTuple import LiveDbDisplayValueTuple
+
+
+def _makeTuples(count: int):
+    return [
+        LiveDbDisplayValueTuple(
+            key="BENCH.%08d" % i,
+            dataType=i % 6,
+            rawValue=str(i * 1.5),
+            displayValue="%s kV" % (i * 1.5),
+        )
+        for i in range(count)
+    ]
+
+
+def _best(func, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        startTime = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - startTime
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tuples", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tuples = _makeTuples(args.tuples)
+    payloadEncoded = Payload(tuples=tuples).toEncodedPayload()
+    codecEncoded = encodeDisplayValueTuples(tuples)
+
+    rows = [[t.key, t.dataType, t.rawValue, t.displayValue] for t in tuples]
+    columnsEncoded = encodeDisplayValueColumns(rows)
+
+    cases = (
+        (
+            "payload encode",
+            lambda: Payload(tuples=tuples).toEncodedPayload(),
+            len(payloadEncoded),
+        ),
+        (
+            "payload decode",
+            lambda: Payload().fromEncodedPayload(payloadEncoded),
+            len(payloadEncoded),
+        ),
+        ("codec encode", lambda: encodeDisplayValueTuples(tuples), len(codecEncoded)),
+        (
+            "codec decode tuples",
+            lambda: decodeDisplayValueTuples(codecEncoded),
+            len(codecEncoded),
+        ),
+        (
+            "codec decode rows",
+            lambda: decodeDisplayValueRows(codecEncoded),
+            len(codecEncoded),
+        ),
+        (
+            "columns encode",
+            lambda: encodeDisplayValueColumns(rows),
+            len(columnsEncoded),
+        ),
+        (
+            "columns decode",
+            lambda: decodeDisplayValueColumns(columnsEncoded),
+            len(columnsEncoded),
+        ),
+        (
+            "columns decode index",
+            lambda: decodeDisplayValueColumns(columnsEncoded).indexByKey(),
+            len(columnsEncoded),
+        ),
+    )
+
+    # Report the cost per 10k tuples, the size of a large bulk load chunk
+    per10k = 10000 / args.tuples
+    for name, func, size in cases:
+        seconds = _best(func, args.repeat)
+        print(
+            "%-20s %8.2fms per 10k tuples, %9d bytes per 10k tuples"
+            % (name, seconds * 1000 * per10k, size * per10k)
+        )
+
+
+if __name__ == "__main__":
+    main()
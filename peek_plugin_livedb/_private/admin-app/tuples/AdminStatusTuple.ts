@@ -9,6 +9,26 @@ export class AdminStatusTuple extends Tuple {
     rawValueQueueSize: number;
     rawValueProcessedTotal: number;
     rawValueLastError: string;
+    rawValueSuppressedTotal: number;
+
+    rawValueQueueItemsPerTask: number;
+    rawValueQueueBlocksMax: number;
+    rawValueQueuePollPeriodMs: number;
+    rawValueWorkerTaskMs: number;
+
+    rawValueBufferFlushLatencyMs: number;
+    rawValueBufferCoalescingRatio: number;
+
+    rawValueQueueWaitP50Ms: number;
+    rawValueQueueWaitP99Ms: number;
+    rawValueWorkerApplyP50Ms: number;
+    rawValueWorkerApplyP99Ms: number;
+    rawValueNotifyP50Ms: number;
+    rawValueNotifyP99Ms: number;
+
+    importItemsInProgress: number;
+    importItemsProcessedTotal: number;
+    importLastError: string;
 
     constructor() {
         super(AdminStatusTuple.tupleName);
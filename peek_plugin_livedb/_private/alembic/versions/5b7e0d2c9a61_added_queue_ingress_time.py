@@ -0,0 +1,37 @@
+"""added queue ingress time
+
+Peek Plugin Database Migration Script
+
+Revision ID: 5b7e0d2c9a61
+Revises: a4d93f0c7b15
+Create Date: 2026-10-18 16:05:27.448190
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "5b7e0d2c9a61"
+down_revision = "a4d93f0c7b15"
+branch_labels = None
+depends_on = None
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    for tableName in ("LiveDbRawValueQueue", "LiveDbRawValuePending"):
+        op.add_column(
+            tableName,
+            sa.Column(
+                "ingressTimeMs",
+                sa.BigInteger(),
+                server_default=sa.text("(extract(epoch from now()) * 1000)::bigint"),
+                nullable=False,
+            ),
+            schema="pl_livedb",
+        )
+
+
+def downgrade():
+    for tableName in ("LiveDbRawValueQueue", "LiveDbRawValuePending"):
+        op.drop_column(tableName, "ingressTimeMs", schema="pl_livedb")
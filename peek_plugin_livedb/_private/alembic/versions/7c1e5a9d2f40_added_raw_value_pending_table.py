@@ -0,0 +1,53 @@
+"""added raw value pending table
+
+Peek Plugin Database Migration Script
+
+Revision ID: 7c1e5a9d2f40
+Revises: 1f014c013f8b
+Create Date: 2026-10-18 09:12:44.201733
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "7c1e5a9d2f40"
+down_revision = "1f014c013f8b"
+branch_labels = None
+depends_on = None
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    op.create_table(
+        "LiveDbRawValuePending",
+        sa.Column(
+            "id",
+            sa.BigInteger(),
+            server_default=sa.text(
+                """nextval('pl_livedb."LiveDbRawValueQueue_id_seq"')"""
+            ),
+            nullable=False,
+        ),
+        sa.Column("modelSetId", sa.Integer(), nullable=False),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("rawValue", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        schema="pl_livedb",
+    )
+    op.create_index(
+        "idx_LiveDbRawValuePending_key",
+        "LiveDbRawValuePending",
+        ["modelSetId", "key"],
+        unique=True,
+        schema="pl_livedb",
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "idx_LiveDbRawValuePending_key",
+        table_name="LiveDbRawValuePending",
+        schema="pl_livedb",
+    )
+    op.drop_table("LiveDbRawValuePending", schema="pl_livedb")
@@ -0,0 +1,35 @@
+"""added queue key index
+
+Peek Plugin Database Migration Script
+
+Revision ID: 8e3f1b6d2c47
+Revises: 5b7e0d2c9a61
+Create Date: 2026-10-18 18:41:09.317524
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "8e3f1b6d2c47"
+down_revision = "5b7e0d2c9a61"
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index(
+        "idx_LiveDbRawValueQueue_key",
+        "LiveDbRawValueQueue",
+        ["modelSetId", "key"],
+        unique=False,
+        schema="pl_livedb",
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "idx_LiveDbRawValueQueue_key",
+        table_name="LiveDbRawValueQueue",
+        schema="pl_livedb",
+    )
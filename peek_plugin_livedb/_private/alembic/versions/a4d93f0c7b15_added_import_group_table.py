@@ -0,0 +1,49 @@
+"""added import group table
+
+Peek Plugin Database Migration Script
+
+Revision ID: a4d93f0c7b15
+Revises: e2b4c81f6a93
+Create Date: 2026-10-18 14:37:05.918342
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "a4d93f0c7b15"
+down_revision = "e2b4c81f6a93"
+branch_labels = None
+depends_on = None
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    op.create_table(
+        "LiveDbImportGroup",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("modelSetId", sa.Integer(), nullable=False),
+        sa.Column("importHash", sa.String(), nullable=False),
+        sa.Column("contentHash", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["modelSetId"], ["pl_livedb.LiveDbModelSet.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        schema="pl_livedb",
+    )
+    op.create_index(
+        "idx_LiveDbImportGroup_importHash",
+        "LiveDbImportGroup",
+        ["modelSetId", "importHash"],
+        unique=True,
+        schema="pl_livedb",
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "idx_LiveDbImportGroup_importHash",
+        table_name="LiveDbImportGroup",
+        schema="pl_livedb",
+    )
+    op.drop_table("LiveDbImportGroup", schema="pl_livedb")
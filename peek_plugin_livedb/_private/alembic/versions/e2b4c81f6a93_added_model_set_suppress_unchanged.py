@@ -0,0 +1,35 @@
+"""added model set suppress unchanged
+
+Peek Plugin Database Migration Script
+
+Revision ID: e2b4c81f6a93
+Revises: 7c1e5a9d2f40
+Create Date: 2026-10-18 10:03:27.518064
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "e2b4c81f6a93"
+down_revision = "7c1e5a9d2f40"
+branch_labels = None
+depends_on = None
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    op.add_column(
+        "LiveDbModelSet",
+        sa.Column(
+            "suppressUnchangedRawValues",
+            sa.Boolean(),
+            server_default=sa.false(),
+            nullable=False,
+        ),
+        schema="pl_livedb",
+    )
+
+
+def downgrade():
+    op.drop_column("LiveDbModelSet", "suppressUnchangedRawValues", schema="pl_livedb")
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from peek_plugin_livedb._private.server.LiveDBReadApi import LiveDBReadApi
 from peek_plugin_livedb._private.server.LiveDBWriteApi import LiveDBWriteApi
 from peek_plugin_livedb._private.server.controller.LiveDbController import (
@@ -6,9 +8,15 @@ from peek_plugin_livedb._private.server.controller.LiveDbController import (
 from peek_plugin_livedb._private.server.controller.LiveDbImportController import (
     LiveDbImportController,
 )
+from peek_plugin_livedb._private.server.controller.LiveDbRawValueBufferController import (
+    LiveDbRawValueBufferController,
+)
 from peek_plugin_livedb._private.server.controller.LiveDbValueUpdateQueueController import (
     LiveDbValueUpdateQueueController,
 )
+from peek_plugin_livedb._private.server.controller.UpdateLatencyController import (
+    UpdateLatencyController,
+)
 from peek_plugin_livedb.server.LiveDBApiABC import LiveDBApiABC
 from peek_plugin_livedb.server.LiveDBReadApiABC import LiveDBReadApiABC
 from peek_plugin_livedb.server.LiveDBWriteApiABC import LiveDBWriteApiABC
@@ -22,19 +30,23 @@ class LiveDBApi(LiveDBApiABC):
     def setup(
         self,
         queueController: LiveDbValueUpdateQueueController,
+        bufferController: Optional[LiveDbRawValueBufferController],
         liveDbController: LiveDbController,
         liveDbImportController: LiveDbImportController,
+        updateLatencyController: UpdateLatencyController,
         dbSessionCreator,
         dbEngine,
     ):
         self._readApi.setup(
             liveDbController=liveDbController,
+            updateLatencyController=updateLatencyController,
             dbSessionCreator=dbSessionCreator,
             dbEngine=dbEngine,
         )
 
         self._writeApi.setup(
             queueController=queueController,
+            bufferController=bufferController,
             liveDbController=liveDbController,
             liveDbImportController=liveDbImportController,
             readApi=self._readApi,
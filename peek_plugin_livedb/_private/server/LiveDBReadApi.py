@@ -1,25 +1,40 @@
 import logging
-from collections import defaultdict
-from typing import List, Optional
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from typing import Dict, List, Optional
 
 from peek_plugin_base.storage.LoadPayloadPgUtil import (
     getTuplesPayloadBlocking,
     LoadPayloadTupleResult,
 )
+from peek_plugin_base.storage.StorageUtil import makeCoreValuesSubqueryCondition
 from peek_plugin_livedb._private.server.controller.LiveDbController import (
     LiveDbController,
 )
+from peek_plugin_livedb._private.server.controller.UpdateLatencyController import (
+    UpdateLatencyController,
+)
 from peek_plugin_livedb._private.storage.LiveDbItem import LiveDbItem
 from peek_plugin_livedb._private.storage.LiveDbModelSet import (
     getOrCreateLiveDbModelSet,
 )
 from peek_plugin_livedb.server.LiveDBReadApiABC import LiveDBReadApiABC
+from peek_plugin_livedb.tuples.LiveDbDisplayValueCodec import (
+    BULK_LOAD_FORMAT_COLUMNS,
+    BULK_LOAD_FORMAT_PAYLOAD,
+    BULK_LOAD_FORMAT_ROWS,
+    BULK_LOAD_FORMATS,
+    encodeDisplayValueColumns,
+    encodeDisplayValueRows,
+)
 from peek_plugin_livedb.tuples.LiveDbDisplayValueTuple import (
     LiveDbDisplayValueTuple,
 )
 from reactivex.subject import Subject
-from sqlalchemy import select
+from sqlalchemy import func, select
+from twisted.internet import defer
 from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
 from vortex.DeferUtil import deferToThreadWrapWithLogger
 
 logger = logging.getLogger(__name__)
@@ -28,6 +43,7 @@ logger = logging.getLogger(__name__)
 class LiveDBReadApi(LiveDBReadApiABC):
     def __init__(self):
         self._liveDbController = None
+        self._updateLatencyController = None
         self._dbSessionCreator = None
         self._dbEngine = None
 
@@ -39,9 +55,14 @@ class LiveDBReadApi(LiveDBReadApiABC):
         self._displayValueUpdatesSubject = defaultdict(Subject)
 
     def setup(
-        self, liveDbController: LiveDbController, dbSessionCreator, dbEngine
+        self,
+        liveDbController: LiveDbController,
+        updateLatencyController: UpdateLatencyController,
+        dbSessionCreator,
+        dbEngine,
     ):
         self._liveDbController = liveDbController
+        self._updateLatencyController = updateLatencyController
         self._dbSessionCreator = dbSessionCreator
         self._dbEngine = dbEngine
 
@@ -65,15 +86,45 @@ class LiveDBReadApi(LiveDBReadApiABC):
         modelSetName: str,
         keyList: Optional[List[str]] = None,
         chunkSize: int = 2500,
+        chunkFormat: str = BULK_LOAD_FORMAT_PAYLOAD,
     ) -> Deferred:
-        offset = 0
-        limit = chunkSize
-        while True:
-            yield qryChunk(
-                modelSetName, offset, limit, keyList, self._dbSessionCreator
+        if chunkFormat not in BULK_LOAD_FORMATS:
+            raise ValueError("Unknown bulk load chunk format %s" % chunkFormat)
+
+        cursor = _BulkLoadCursor()
+        while not cursor.finished:
+            # The next chunk starts after the last id of this one
+            if cursor.loading:
+                raise Exception(
+                    "bulkLoadDeferredGenerator chunks must be loaded one at a time,"
+                    " wait for each deferred before requesting the next"
+                )
+
+            cursor.loading = True
+            d = qryChunk(
+                modelSetName,
+                cursor.lastId,
+                cursor.keyIds,
+                chunkSize,
+                keyList,
+                self._dbSessionCreator,
+                chunkFormat,
+            )
+            d.addBoth(cursor.chunkLoaded)
+            yield d
+
+    def getLiveDbDisplayValues(
+        self, modelSetName: str, liveDbKeys: List[str]
+    ) -> Deferred:
+        if not liveDbKeys:
+            return defer.succeed([])
+
+        if self._liveDbController.isLoaded:
+            return defer.succeed(
+                self._liveDbController.getDisplayValues(modelSetName, liveDbKeys)
             )
 
-            offset += limit
+        return qryDisplayValues(modelSetName, liveDbKeys, self._dbSessionCreator)
 
     def rawValueUpdatesObservable(self, modelSetName: str) -> Subject:
         return self._rawValueUpdatesSubject[modelSetName]
@@ -81,21 +132,85 @@ class LiveDBReadApi(LiveDBReadApiABC):
     def displayValueUpdatesObservable(self, modelSetName: str) -> Subject:
         return self._displayValueUpdatesSubject[modelSetName]
 
+    def updateLatencyMetrics(self) -> Dict[str, Dict]:
+        return self._updateLatencyController.metrics()
+
+
+class _BulkLoadCursor:
+    """Bulk Load Cursor
+
+    This carries the position of a bulk load between chunks, the chunks are paged
+    with "id > lastId" rather than an offset, so each chunk costs the same.
+
+    If the load is for a list of keys, the keys are resolved to item ids once, by
+    the first chunk, and the chunks then page through those ids.
+
+    The cursor is only advanced from the result of each chunk, on the reactor
+    thread, the chunk queries don't share it.
+
+    """
+
+    __slots__ = ("lastId", "finished", "loading", "keyIds")
+
+    def __init__(self):
+        self.lastId = 0
+        self.finished = False
+        self.loading = False
+        self.keyIds: Optional[List[int]] = None
+
+    def chunkLoaded(self, chunk):
+        self.loading = False
+
+        # A failed chunk can be requested again, from the same position
+        if isinstance(chunk, Failure):
+            return chunk
+
+        # The empty result that marks the end
+        if chunk.lastId is None:
+            self.finished = True
+        else:
+            self.lastId = chunk.lastId
+            self.keyIds = chunk.keyIds
+
+        return chunk.result
+
+
+_BulkLoadChunk = namedtuple("_BulkLoadChunk", ["result", "lastId", "keyIds"])
+
+#: The number of keys to resolve to ids per query
+KEY_RESOLVE_CHUNK_SIZE = 5000
+
 
 @deferToThreadWrapWithLogger(logger)
 def qryChunk(
     modelSetKey: str,
-    offset: int,
+    lastId: int,
+    keyIds: Optional[List[int]],
     limit: int,
-    keyList: List[str],
+    keyList: Optional[List[str]],
     dbSessionCreator,
-) -> LoadPayloadTupleResult:
+    chunkFormat: str = BULK_LOAD_FORMAT_PAYLOAD,
+) -> _BulkLoadChunk:
+    """Query Chunk
+
+    Load the chunk of items after lastId.
+
+    :param keyIds: The sorted item ids of keyList, from the previous chunk, or None
+        for the first chunk.
+    :returns: The chunk, its lastId is None when there are no more items.
+
+    """
+    emptyChunk = _BulkLoadChunk(
+        LoadPayloadTupleResult(encodedPayload=None, count=0), None, None
+    )
+
     # If they've given us an empty key list, that is what they will get back
     if keyList is not None and not keyList:
-        return LoadPayloadTupleResult(encodedPayload=None, count=0)
+        return emptyChunk
 
     table = LiveDbItem.__table__
     cols = [
+        table.c.id,
         table.c.key,
         table.c.dataType,
         table.c.rawValue,
@@ -106,23 +221,150 @@ def qryChunk(
     try:
         liveDbModelSet = getOrCreateLiveDbModelSet(session, modelSetKey)
 
+        if keyList is not None and keyIds is None:
+            keyIds = _resolveKeyIds(session, table, liveDbModelSet.id, keyList)
+
+        while True:
+            sql = (
+                select(cols)
+                .where(table.c.modelSetId == liveDbModelSet.id)
+                .where(table.c.id > lastId)
+                .order_by(table.c.id)
+            )
+
+            if keyList is not None:
+                start = bisect_right(keyIds, lastId)
+                ids = keyIds[start : start + limit]
+                if not ids:
+                    return emptyChunk
+
+                sql = sql.where(table.c.id.in_(ids))
+
+            else:
+                ids = None
+                sql = sql.limit(limit)
+
+            chunk = _qryChunkBlocking(
+                session, dbSessionCreator, table, cols, sql, ids, limit, chunkFormat
+            )
+
+            # A range load has reached the end, or the chunk has items
+            if keyList is None or chunk.result.count:
+                return _BulkLoadChunk(chunk.result, chunk.lastId, keyIds)
+
+            # The items of these ids have all been deleted since the keys were
+            # resolved, move on to the next ids
+            lastId = ids[-1]
+
+    finally:
+        session.close()
+
+
+def _qryChunkBlocking(
+    session,
+    dbSessionCreator,
+    table,
+    cols,
+    sql,
+    ids: Optional[List[int]],
+    limit: int,
+    chunkFormat: str,
+) -> _BulkLoadChunk:
+    # The keyIds of the returned chunk are filled in by qryChunk
+    emptyChunk = _BulkLoadChunk(
+        LoadPayloadTupleResult(encodedPayload=None, count=0), None, None
+    )
+
+    # The rows and columns formats are encoded here, not in PostgreSQL, they're
+    # cheap to encode, and the last id is read from the rows
+    if chunkFormat in (BULK_LOAD_FORMAT_ROWS, BULK_LOAD_FORMAT_COLUMNS):
+        rows = session.execute(sql).fetchall()
+        if not rows:
+            return emptyChunk
+
+        chunkLastId = rows[-1][0]
+        rows = [tuple(row)[1:] for row in rows]
+
+        if chunkFormat == BULK_LOAD_FORMAT_ROWS:
+            encodedPayload = encodeDisplayValueRows(rows)
+        else:
+            encodedPayload = encodeDisplayValueColumns(rows)
+
+        return _BulkLoadChunk(
+            LoadPayloadTupleResult(encodedPayload=encodedPayload, count=len(rows)),
+            chunkLastId,
+            None,
+        )
+
+    # The payload is encoded in PostgreSQL, it doesn't return the rows, so the
+    # range load finds the id this chunk ends at first
+    if ids is not None:
+        chunkLastId = ids[-1]
+
+    else:
+        idsSql = sql.with_only_columns([table.c.id]).alias("ids")
+        chunkLastId = session.execute(select([func.max(idsSql.c.id)])).scalar()
+        if chunkLastId is None:
+            return emptyChunk
+
+        sql = sql.limit(None).where(table.c.id <= chunkLastId)
+
+    result = getTuplesPayloadBlocking(
+        dbSessionCreator,
+        sql.with_only_columns(cols[1:]),
+        LiveDbDisplayValueTuple.sqlCoreLoad,
+        fetchSize=limit,
+    )
+    return _BulkLoadChunk(result, chunkLastId, None)
+
+
+def _resolveKeyIds(session, table, modelSetId: int, keyList: List[str]) -> List[int]:
+    # Resolve the keys to ids once, for the whole load
+    keyIds = []
+    keyList = list(set(keyList))
+    for start in range(0, len(keyList), KEY_RESOLVE_CHUNK_SIZE):
         sql = (
-            select(cols)
-            .order_by(table.c.id)
-            .where(table.c.modelSetId == liveDbModelSet.id)
+            select([table.c.id])
+            .where(table.c.modelSetId == modelSetId)
+            .where(
+                makeCoreValuesSubqueryCondition(
+                    session.bind,
+                    table.c.key,
+                    keyList[start : start + KEY_RESOLVE_CHUNK_SIZE],
+                )
+            )
         )
+        keyIds.extend([row[0] for row in session.execute(sql).fetchall()])
 
-        if keyList is not None:
-            sql = sql.where(table.c.key.in_(keyList))
+    return sorted(keyIds)
 
-        sql = sql.offset(offset).limit(limit)
 
-        return getTuplesPayloadBlocking(
-            dbSessionCreator,
-            sql,
-            LiveDbDisplayValueTuple.sqlCoreLoad,
-            fetchSize=limit,
+@deferToThreadWrapWithLogger(logger)
+def qryDisplayValues(
+    modelSetKey: str, liveDbKeys: List[str], dbSessionCreator
+) -> List[LiveDbDisplayValueTuple]:
+    table = LiveDbItem.__table__
+    cols = [
+        table.c.key,
+        table.c.dataType,
+        table.c.rawValue,
+        table.c.displayValue,
+    ]
+
+    session = dbSessionCreator()
+    try:
+        liveDbModelSet = getOrCreateLiveDbModelSet(session, modelSetKey)
+
+        sql = (
+            select(cols)
+            .where(table.c.modelSetId == liveDbModelSet.id)
+            .where(table.c.key.in_(list(set(liveDbKeys))))
         )
 
+        return [
+            LiveDbDisplayValueTuple.sqlCoreLoad(row)
+            for row in session.execute(sql).fetchall()
+        ]
+
     finally:
         session.close()
@@ -1,5 +1,5 @@
 import logging
-from typing import List
+from typing import Dict, List, Optional
 
 from twisted.internet import defer
 from twisted.internet.defer import Deferred, inlineCallbacks
@@ -11,6 +11,9 @@ from peek_plugin_livedb._private.server.controller.LiveDbController import (
 from peek_plugin_livedb._private.server.controller.LiveDbImportController import (
     LiveDbImportController,
 )
+from peek_plugin_livedb._private.server.controller.LiveDbRawValueBufferController import (
+    LiveDbRawValueBufferController,
+)
 from peek_plugin_livedb._private.server.controller.LiveDbValueUpdateQueueController import (
     LiveDbValueUpdateQueueController,
 )
@@ -26,6 +29,7 @@ logger = logging.getLogger(__name__)
 class LiveDBWriteApi(LiveDBWriteApiABC):
     def __init__(self):
         self._queueController = None
+        self._bufferController = None
         self._liveDbController = None
         self._liveDbImportController = None
         self._readApi = None
@@ -35,6 +39,7 @@ class LiveDBWriteApi(LiveDBWriteApiABC):
     def setup(
         self,
         queueController: LiveDbValueUpdateQueueController,
+        bufferController: Optional[LiveDbRawValueBufferController],
         liveDbController: LiveDbController,
         liveDbImportController: LiveDbImportController,
         readApi: LiveDBReadApi,
@@ -42,6 +47,7 @@ class LiveDBWriteApi(LiveDBWriteApiABC):
         dbEngine,
     ):
         self._queueController = queueController
+        self._bufferController = bufferController
         self._liveDbController = liveDbController
         self._liveDbImportController = liveDbImportController
         self._readApi = readApi
@@ -56,13 +62,29 @@ class LiveDBWriteApi(LiveDBWriteApiABC):
         self, modelSetName: str, updates: List[LiveDbRawValueUpdateTuple]
     ) -> Deferred:
         """Update Raw Values"""
+        updates = self._liveDbController.filterChangedRawValues(modelSetName, updates)
         if not updates:
             return
 
-        yield self._queueController.queueData(modelSetName, updates)
+        try:
+            if self._bufferController:
+                yield self._bufferController.bufferRawValues(modelSetName, updates)
+            else:
+                yield self._queueController.queueData(modelSetName, updates)
+
+        except Exception:
+            self._liveDbController.forgetRawValues(modelSetName, updates)
+            raise
 
         self._readApi.rawValueUpdatesObservable(modelSetName).on_next(updates)
 
+    def setSuppressUnchangedRawValues(
+        self, modelSetName: str, enabled: bool
+    ) -> Deferred:
+        return self._liveDbController.setSuppressUnchangedRawValues(
+            modelSetName, enabled
+        )
+
     def importLiveDbItems(
         self, modelSetName: str, newItems: List[ImportLiveDbItemTuple]
     ) -> Deferred:
@@ -71,6 +93,31 @@ class LiveDBWriteApi(LiveDBWriteApiABC):
 
         return self._liveDbImportController.importLiveDbItems(modelSetName, newItems)
 
+    def importLiveDbItemGroups(
+        self,
+        modelSetName: str,
+        newItemsByImportHash: Dict[str, List[ImportLiveDbItemTuple]],
+    ) -> Deferred:
+        if not newItemsByImportHash:
+            return defer.succeed(0)
+
+        return self._liveDbImportController.importLiveDbItemGroups(
+            modelSetName, newItemsByImportHash
+        )
+
+    def deleteLiveDbItems(self, modelSetName: str, liveDbKeys: List[str]) -> Deferred:
+        if not liveDbKeys:
+            return defer.succeed(0)
+
+        return self._liveDbImportController.deleteLiveDbItems(modelSetName, liveDbKeys)
+
+    def deleteLiveDbItemsByImportHash(
+        self, modelSetName: str, importHash: str
+    ) -> Deferred:
+        return self._liveDbImportController.deleteLiveDbItemsByImportHash(
+            modelSetName, importHash
+        )
+
     def prioritiseLiveDbValueAcquisition(
         self, modelSetName: str, liveDbKeys: List[str]
     ) -> Deferred:
@@ -1,6 +1,6 @@
 import logging
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import Deferred, inlineCallbacks
 from vortex.DeferUtil import deferToThreadWrapWithLogger
 
 from peek_plugin_base.server.PluginLogicEntryHookABC import PluginLogicEntryHookABC
@@ -26,10 +26,25 @@ from .TupleDataObservable import makeTupleDataObservableHandler
 from .admin_backend import makeAdminBackendHandlers
 from .controller.AdminStatusController import AdminStatusController
 from .controller.LiveDbValueUpdateQueueController import (
+    LiveDbValuePendingQueueController,
     LiveDbValueUpdateQueueController,
 )
+from .controller.LiveDbRawValueBufferController import (
+    LiveDbRawValueBufferController,
+)
 from .controller.MainController import MainController
-from ..storage.Setting import VALUE_UPDATER_ENABLED, globalProperties, globalSetting
+from .controller.UpdateLatencyController import UpdateLatencyController
+from ..storage.Setting import (
+    IMPORT_ADDITIONS_CHUNK_SIZE,
+    RAW_VALUE_BUFFER_ENABLED,
+    RAW_VALUE_PENDING_QUEUE_ENABLED,
+    RAW_VALUE_QUEUE_UNLOGGED,
+    VALUE_UPDATER_ADAPTIVE_SIZING,
+    VALUE_UPDATER_ENABLED,
+    VALUE_UPDATER_SHARD_COUNT,
+    globalProperties,
+    globalSetting,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -77,6 +92,8 @@ class LogicEntryHook(
 
         """
 
+        settings = yield self._loadSettings()
+
         # ----------------
         # create the Status Controller
         statusController = AdminStatusController()
@@ -113,36 +130,70 @@ class LogicEntryHook(
 
         # ----------------
         # Create the LiveDB controller
-        liveDbController = LiveDbController(self.dbSessionCreator)
+        liveDbController = LiveDbController(self.dbSessionCreator, statusController)
         self._loadedObjects.append(liveDbController)
+        liveDbController.start()
 
         # ----------------
         # Create the Import Controller
-        liveDbImportController = LiveDbImportController(self.dbSessionCreator)
+        liveDbImportController = LiveDbImportController(
+            self.dbSessionCreator,
+            liveDbController,
+            statusController,
+            additionsChunkSize=settings[IMPORT_ADDITIONS_CHUNK_SIZE],
+        )
         self._loadedObjects.append(liveDbImportController)
 
+        # ----------------
+        # Create the Update Latency Controller
+        updateLatencyController = UpdateLatencyController(statusController)
+        self._loadedObjects.append(updateLatencyController)
+
         # ----------------
         # Create the Queue Controller
-        queueController = LiveDbValueUpdateQueueController(
-            self.dbSessionCreator, statusController
+        if settings[RAW_VALUE_PENDING_QUEUE_ENABLED]:
+            QueueController = LiveDbValuePendingQueueController
+        else:
+            QueueController = LiveDbValueUpdateQueueController
+
+        queueController = QueueController(
+            self.dbSessionCreator,
+            statusController,
+            liveDbController,
+            adaptiveSizing=settings[VALUE_UPDATER_ADAPTIVE_SIZING],
+            shardCount=settings[VALUE_UPDATER_SHARD_COUNT],
+            dbEngine=self.dbEngine,
+            updateLatencyController=updateLatencyController,
         )
         self._loadedObjects.append(queueController)
+        yield queueController.setQueueTablesUnlogged(settings[RAW_VALUE_QUEUE_UNLOGGED])
+        yield queueController.moveRowsFromOtherQueue()
+
+        # ----------------
+        # Create the Raw Value Buffer Controller, if it's enabled
+        bufferController = None
+        if settings[RAW_VALUE_BUFFER_ENABLED]:
+            bufferController = LiveDbRawValueBufferController(
+                queueController, statusController
+            )
+            self._loadedObjects.append(bufferController)
 
         # ----------------
         # Initialise the API object that will be shared with other plugins
         self._api.setup(
             queueController=queueController,
+            bufferController=bufferController,
             liveDbController=liveDbController,
             liveDbImportController=liveDbImportController,
+            updateLatencyController=updateLatencyController,
             dbSessionCreator=self.dbSessionCreator,
             dbEngine=self.dbEngine,
         )
 
         # ----------------
         # Start the queue controller
-
-        settings = yield self._loadSettings()
-
+        # noinspection PyTypeChecker
+        queueController.setReadApi(self._api.readApi)
         if settings[VALUE_UPDATER_ENABLED]:
             queueController.start()
 
@@ -151,15 +202,20 @@ class LogicEntryHook(
 
         logger.debug("Started")
 
+    @inlineCallbacks
     def stop(self):
         """Stop
 
         This method is called by the platform to tell the peek app to shutdown and stop
         everything it's doing
         """
-        # Shutdown and dereference all objects we constructed when we started
+        # Shutdown and dereference all objects we constructed when we started,
+        # wait for the ones that return a deferred, the raw value buffer queues its
+        # values before the queue controller is shutdown.
         while self._loadedObjects:
-            self._loadedObjects.pop().shutdown()
+            d = self._loadedObjects.pop().shutdown()
+            if isinstance(d, Deferred):
+                yield d
 
         self._api = None
 
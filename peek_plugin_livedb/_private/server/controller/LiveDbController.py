@@ -1,11 +1,461 @@
 import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import pytz
+from sqlalchemy import select
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, inlineCallbacks
+from vortex.DeferUtil import deferToThreadWrapWithLogger, vortexLogFailure
+
+from peek_plugin_livedb._private.server.controller.AdminStatusController import (
+    AdminStatusController,
+)
+from peek_plugin_livedb._private.storage.LiveDbItem import LiveDbItem
+from peek_plugin_livedb._private.storage.LiveDbModelSet import (
+    LiveDbModelSet,
+    getOrCreateLiveDbModelSet,
+)
+from peek_plugin_livedb.tuples.LiveDbDisplayValueTuple import (
+    LiveDbDisplayValueTuple,
+)
+from peek_plugin_livedb.tuples.LiveDbRawValueUpdateTuple import (
+    LiveDbRawValueUpdateTuple,
+)
 
 logger = logging.getLogger(__name__)
 
+# (dataType, rawValue, displayValue)
+_ValueT = Tuple[int, str, str]
+
 
 class LiveDbController(object):
-    def __init__(self, dbSessionCreator):
+    """LiveDB Controller
+
+    This controller keeps a resident copy of the LiveDB values in the logic
+    service, indexed by model set key, then item key.
+
+    The values are loaded from the database once at startup, then kept up to date
+    from the worker results and the import path, so point reads don't have to go to
+    the database.
+
+    A raw value and its display value are only updated together, when the worker
+    has written them, so a read never returns a new raw value with the display
+    value of the old one.
+
+    For model sets with suppressUnchangedRawValues set, the resident raw values are
+    used to drop updates that don't change the value, before they are queued. The
+    raw values that have been accepted, but not yet written by the worker, are kept
+    separately, so an update is compared with the last value accepted for its key.
+
+    All access to the resident values is from the reactor thread.
+
+    """
+
+    LOAD_CHUNK_SIZE = 50000
+
+    #: A failed load is retried after this, doubling up to LOAD_RETRY_MAX_SECONDS
+    LOAD_RETRY_SECONDS = 5.0
+    LOAD_RETRY_MAX_SECONDS = 300.0
+
+    def __init__(
+        self, dbSessionCreator, adminStatusController: AdminStatusController
+    ):
         self._dbSessionCreator = dbSessionCreator
+        self._adminStatusController = adminStatusController
+
+        self._valuesByModelSetKey: Dict[str, Dict[str, _ValueT]] = defaultdict(dict)
+        self._suppressUnchangedModelSetKeys = set()
+
+        # The raw values accepted for suppressed model sets that the worker hasn't
+        # written yet, by model set key, then item key.
+        self._acceptedRawValuesByModelSetKey: Dict[str, Dict[str, str]] = defaultdict(
+            dict
+        )
+
+        # Workers cache item dataTypes, this tells them when to drop the cache.
+        # It starts from the time so a restarted logic service won't reuse one.
+        self._dataTypeGeneration = int(time.time() * 1000)
+
+        self._isLoaded = False
+        self._loadRetrySeconds = self.LOAD_RETRY_SECONDS
+        self._loadRetryCall = None
+        self._isShutdown = False
+
+        # Values written while the initial load is running, the load must not
+        # overwrite these with older values from the database.
+        self._keysChangedDuringLoad = defaultdict(set)
+        self._valuesUpdatedDuringLoad = defaultdict(dict)
+
+    def start(self):
+        self._startLoad()
 
     def shutdown(self):
-        pass
+        self._isShutdown = True
+        if self._loadRetryCall and self._loadRetryCall.active():
+            self._loadRetryCall.cancel()
+        self._loadRetryCall = None
+
+        self._valuesByModelSetKey.clear()
+        self._acceptedRawValuesByModelSetKey.clear()
+        self._keysChangedDuringLoad.clear()
+        self._valuesUpdatedDuringLoad.clear()
+        self._isLoaded = False
+
+    @property
+    def isLoaded(self) -> bool:
+        return self._isLoaded
+
+    # ---------------
+    # Read methods
+
+    def getDisplayValues(
+        self, modelSetKey: str, liveDbKeys: List[str]
+    ) -> List[LiveDbDisplayValueTuple]:
+        """Get Display Values
+
+        Return the resident values for the keys, keys that don't exist in the
+        LiveDB are not returned.
+
+        """
+        assert self._isLoaded, "LiveDbController has not finished loading"
+
+        values = self._valuesByModelSetKey.get(modelSetKey, {})
+
+        results = []
+        for key in set(liveDbKeys):
+            value = values.get(key)
+            if value is None:
+                continue
+
+            results.append(
+                LiveDbDisplayValueTuple(
+                    key=key,
+                    dataType=value[0],
+                    rawValue=value[1],
+                    displayValue=value[2],
+                )
+            )
+
+        return results
+
+    @property
+    def dataTypeGeneration(self) -> int:
+        """Data Type Generation
+
+        This changes every time items are imported or deleted, it's sent to the
+        workers with the value updates, see LiveDbItemUpdateTask.
+
+        """
+        return self._dataTypeGeneration
+
+    def dataTypesChanged(self) -> None:
+        self._dataTypeGeneration += 1
+
+    # ---------------
+    # Suppression methods
+
+    def filterChangedRawValues(
+        self, modelSetKey: str, updates: List[LiveDbRawValueUpdateTuple]
+    ) -> List[LiveDbRawValueUpdateTuple]:
+        """Filter Changed Raw Values
+
+        Drop the updates that won't change the raw value of an item, if the model
+        set has suppression enabled.
+
+        The updates that are kept are recorded as the last accepted raw value of
+        their keys, before this returns, so updates from overlapping calls are
+        compared with them. Call forgetRawValues if they are then not queued.
+
+        Nothing is dropped until the resident values have loaded.
+
+        """
+        if not self._isLoaded:
+            return updates
+
+        if modelSetKey not in self._suppressUnchangedModelSetKeys:
+            return updates
+
+        values = self._valuesByModelSetKey[modelSetKey]
+        acceptedRawValues = self._acceptedRawValuesByModelSetKey[modelSetKey]
+
+        changed = []
+        for update in updates:
+            value = values.get(update.key)
+            if value is None:
+                changed.append(update)
+                continue
+
+            lastRawValue = acceptedRawValues.get(update.key, value[1])
+            if lastRawValue == update.rawValue:
+                continue
+
+            changed.append(update)
+            acceptedRawValues[update.key] = update.rawValue
+
+        suppressedCount = len(updates) - len(changed)
+        if suppressedCount:
+            status = self._adminStatusController.status
+            status.rawValueSuppressedTotal += suppressedCount
+            self._adminStatusController.notify()
+
+        return changed
+
+    def forgetRawValues(
+        self, modelSetKey: str, updates: List[LiveDbRawValueUpdateTuple]
+    ) -> None:
+        """Forget Raw Values
+
+        Forget the raw values accepted by filterChangedRawValues, when they failed
+        to be queued, so the next updates are compared with the resident values.
+
+        """
+        acceptedRawValues = self._acceptedRawValuesByModelSetKey.get(modelSetKey)
+        if not acceptedRawValues:
+            return
+
+        for update in updates:
+            if acceptedRawValues.get(update.key) == update.rawValue:
+                del acceptedRawValues[update.key]
+
+    @inlineCallbacks
+    def setSuppressUnchangedRawValues(self, modelSetKey: str, enabled: bool):
+        yield self._storeSuppressUnchangedRawValues(modelSetKey, enabled)
+
+        if enabled:
+            self._suppressUnchangedModelSetKeys.add(modelSetKey)
+        else:
+            self._suppressUnchangedModelSetKeys.discard(modelSetKey)
+            self._acceptedRawValuesByModelSetKey.pop(modelSetKey, None)
+
+    @deferToThreadWrapWithLogger(logger)
+    def _storeSuppressUnchangedRawValues(self, modelSetKey: str, enabled: bool):
+        table = LiveDbModelSet.__table__
+
+        session = self._dbSessionCreator()
+        try:
+            modelSet = getOrCreateLiveDbModelSet(session, modelSetKey)
+            session.execute(
+                table.update()
+                .where(table.c.id == modelSet.id)
+                .values(suppressUnchangedRawValues=enabled)
+            )
+            session.commit()
+
+        finally:
+            session.close()
+
+    # ---------------
+    # Write methods
+
+    def updateDisplayValues(
+        self, modelSetKey: str, tuples: List[LiveDbDisplayValueTuple]
+    ) -> None:
+        """Update Display Values
+
+        Apply the raw and display values the worker has written to the database.
+
+        """
+        values = self._valuesByModelSetKey[modelSetKey]
+
+        if not self._isLoaded:
+            valuesUpdated = self._valuesUpdatedDuringLoad[modelSetKey]
+            for tuple_ in tuples:
+                valuesUpdated[tuple_.key] = (tuple_.rawValue, tuple_.displayValue)
+
+        for tuple_ in tuples:
+            value = values.get(tuple_.key)
+            # The key doesn't exist (or isn't loaded yet)
+            if value is None:
+                continue
+
+            values[tuple_.key] = (value[0], tuple_.rawValue, tuple_.displayValue)
+
+        # The accepted raw values that have now been written
+        acceptedRawValues = self._acceptedRawValuesByModelSetKey.get(modelSetKey)
+        if acceptedRawValues:
+            for tuple_ in tuples:
+                if acceptedRawValues.get(tuple_.key) == tuple_.rawValue:
+                    del acceptedRawValues[tuple_.key]
+
+    def addItems(
+        self, modelSetKey: str, tuples: List[LiveDbDisplayValueTuple]
+    ) -> None:
+        values = self._valuesByModelSetKey[modelSetKey]
+
+        for tuple_ in tuples:
+            values[tuple_.key] = (
+                tuple_.dataType,
+                tuple_.rawValue,
+                tuple_.displayValue,
+            )
+
+        if not self._isLoaded:
+            self._keysChangedDuringLoad[modelSetKey].update([t.key for t in tuples])
+
+        self.dataTypesChanged()
+
+    def updateDataTypes(
+        self, modelSetKey: str, tuples: List[LiveDbDisplayValueTuple]
+    ) -> None:
+        """Update Data Types
+
+        Apply the dataTypes of re-imported items, their values are left as they are.
+
+        """
+        values = self._valuesByModelSetKey[modelSetKey]
+
+        for tuple_ in tuples:
+            value = values.get(tuple_.key)
+            if value is None:
+                values[tuple_.key] = (
+                    tuple_.dataType,
+                    tuple_.rawValue,
+                    tuple_.displayValue,
+                )
+            else:
+                values[tuple_.key] = (tuple_.dataType, value[1], value[2])
+
+        # Stop the load from overwriting these with the old dataTypes
+        if not self._isLoaded:
+            self._keysChangedDuringLoad[modelSetKey].update([t.key for t in tuples])
+
+        self.dataTypesChanged()
+
+    def deleteItems(self, modelSetKey: str, keys: List[str]) -> None:
+        values = self._valuesByModelSetKey[modelSetKey]
+
+        acceptedRawValues = self._acceptedRawValuesByModelSetKey.get(modelSetKey, {})
+        for key in keys:
+            values.pop(key, None)
+            acceptedRawValues.pop(key, None)
+
+        # Stop the load from adding the items back
+        if not self._isLoaded:
+            self._keysChangedDuringLoad[modelSetKey].update(keys)
+
+        self.dataTypesChanged()
+
+    # ---------------
+    # Load methods
+
+    def _startLoad(self):
+        self._loadRetryCall = None
+        d = self._loadAll()
+        d.addErrback(self._loadFailed)
+
+    def _loadFailed(self, failure):
+        """Load Failed
+
+        Drop what was loaded, then retry the load, until it succeeds suppression is
+        off and reads go to the database.
+
+        """
+        vortexLogFailure(failure, logger)
+
+        self._valuesByModelSetKey.clear()
+        self._keysChangedDuringLoad.clear()
+        self._valuesUpdatedDuringLoad.clear()
+
+        if self._isShutdown:
+            return
+
+        logger.warning(
+            "Loading the LiveDB values failed, retrying in %ss", self._loadRetrySeconds
+        )
+        self._loadRetryCall = reactor.callLater(
+            self._loadRetrySeconds, self._startLoad
+        )
+        self._loadRetrySeconds = min(
+            self._loadRetrySeconds * 2, self.LOAD_RETRY_MAX_SECONDS
+        )
+
+    @inlineCallbacks
+    def _loadAll(self) -> Deferred:
+        startTime = datetime.now(pytz.utc)
+
+        modelSetKeyById = {}
+        for modelSetId, modelSetKey, suppressUnchanged in (
+            yield self._loadModelSets()
+        ):
+            modelSetKeyById[modelSetId] = modelSetKey
+            if suppressUnchanged:
+                self._suppressUnchangedModelSetKeys.add(modelSetKey)
+
+        total = 0
+        for modelSetId, modelSetKey in modelSetKeyById.items():
+            lastId = 0
+            while True:
+                rows = yield self._loadChunk(modelSetId, lastId)
+                if not rows:
+                    break
+
+                lastId = rows[-1][0]
+                total += len(rows)
+                self._applyLoadedRows(modelSetKey, rows)
+
+        self._isLoaded = True
+        self._keysChangedDuringLoad.clear()
+        self._valuesUpdatedDuringLoad.clear()
+
+        logger.info(
+            "Loaded %s LiveDB values into memory in %s",
+            total,
+            datetime.now(pytz.utc) - startTime,
+        )
+
+    def _applyLoadedRows(self, modelSetKey: str, rows) -> None:
+        values = self._valuesByModelSetKey[modelSetKey]
+        keysChanged = self._keysChangedDuringLoad.get(modelSetKey, ())
+        valuesUpdated = self._valuesUpdatedDuringLoad.get(modelSetKey, {})
+
+        for id_, key, dataType, rawValue, displayValue in rows:
+            if key in keysChanged:
+                continue
+            rawValue, displayValue = valuesUpdated.get(key, (rawValue, displayValue))
+            values[key] = (dataType, rawValue, displayValue)
+
+    @deferToThreadWrapWithLogger(logger)
+    def _loadModelSets(self) -> List[Tuple[int, str, bool]]:
+        table = LiveDbModelSet.__table__
+
+        session = self._dbSessionCreator()
+        try:
+            result = session.execute(
+                select(
+                    [table.c.id, table.c.key, table.c.suppressUnchangedRawValues]
+                )
+            )
+            return [tuple(row) for row in result.fetchall()]
+
+        finally:
+            session.close()
+
+    @deferToThreadWrapWithLogger(logger)
+    def _loadChunk(self, modelSetId: int, lastId: int) -> List[tuple]:
+        table = LiveDbItem.__table__
+
+        session = self._dbSessionCreator()
+        try:
+            sql = (
+                select(
+                    [
+                        table.c.id,
+                        table.c.key,
+                        table.c.dataType,
+                        table.c.rawValue,
+                        table.c.displayValue,
+                    ]
+                )
+                .where(table.c.modelSetId == modelSetId)
+                .where(table.c.id > lastId)
+                .order_by(table.c.id)
+                .limit(self.LOAD_CHUNK_SIZE)
+            )
+
+            return [tuple(row) for row in session.execute(sql).fetchall()]
+
+        finally:
+            session.close()
@@ -1,29 +1,98 @@
+import hashlib
 import logging
-from typing import List
+from typing import Dict, Iterable, List, Set
 
-from twisted.internet.defer import Deferred, inlineCallbacks
-from vortex.Payload import Payload
+from sqlalchemy import select
+from twisted.internet import reactor
+from twisted.internet.defer import (
+    Deferred,
+    DeferredList,
+    DeferredSemaphore,
+    gatherResults,
+    inlineCallbacks,
+)
+from twisted.internet.task import deferLater
+from vortex.DeferUtil import deferToThreadWrapWithLogger
 
 from peek_plugin_livedb._private.server.LiveDBReadApi import LiveDBReadApi
+from peek_plugin_livedb._private.server.controller.AdminStatusController import (
+    AdminStatusController,
+)
+from peek_plugin_livedb._private.server.controller.LiveDbController import (
+    LiveDbController,
+)
+from peek_plugin_livedb._private.storage.LiveDbImportGroup import LiveDbImportGroup
+from peek_plugin_livedb._private.storage.LiveDbModelSet import (
+    getOrCreateLiveDbModelSet,
+)
+from peek_plugin_livedb._private.worker.tasks.LiveDbItemDeleteTask import (
+    deleteLiveDbItems,
+    deleteLiveDbItemsByImportHash,
+)
 from peek_plugin_livedb._private.worker.tasks.LiveDbItemImportTask import (
+    finishLiveDbItemGroupImport,
+    importLiveDbItemGroup,
     importLiveDbItems,
 )
 from peek_plugin_livedb.tuples.ImportLiveDbItemTuple import ImportLiveDbItemTuple
+from peek_plugin_livedb.tuples.LiveDbDisplayValueCodec import decodeDisplayValueRows
+from peek_plugin_livedb.tuples.LiveDbDisplayValueTuple import (
+    LiveDbDisplayValueTuple,
+)
 
 logger = logging.getLogger(__name__)
 
 
 class LiveDbImportController:
-    """LiveDB Import Controller"""
+    """LiveDB Import Controller
+
+    Imports are split into chunks of IMPORT_CHUNK_SIZE items as they are read, each
+    chunk is imported by a worker task in its own transaction.
+
+    At most IMPORT_PARALLEL_TASKS chunks are in progress at once, across all
+    imports, this bounds the memory used by the tasks and their results.
+
+    Group imports send each changed group to a worker task instead, groups with an
+    unchanged content hash are skipped, see LiveDbImportGroup. Groups larger than
+    IMPORT_CHUNK_SIZE are imported in chunks, then finished by one more task.
+
+    The new items are emitted on the additions observable in lists of at most
+    additionsChunkSize tuples, the reactor is given a turn between each list.
+
+    The workers return the imported rows encoded with LiveDbDisplayValueCodec,
+    which keeps the task results small.
+
+    """
+
+    #: The number of items imported by each worker task
+    IMPORT_CHUNK_SIZE = 10000
+
+    #: The number of import worker tasks run at once
+    IMPORT_PARALLEL_TASKS = 4
+
+    #: The number of items deleted by each worker task
+    DELETE_CHUNK_SIZE = 5000
 
-    def __init__(self, dbSessionCreator):
+    def __init__(
+        self,
+        dbSessionCreator,
+        liveDbController: LiveDbController,
+        adminStatusController: AdminStatusController,
+        additionsChunkSize: int,
+    ):
         self._dbSessionCreator = dbSessionCreator
+        self._liveDbController = liveDbController
+        self._adminStatusController = adminStatusController
+        self._additionsChunkSize = max(additionsChunkSize, 1)
+
+        self._importSemaphore = DeferredSemaphore(self.IMPORT_PARALLEL_TASKS)
 
     def setReadApi(self, readApi: LiveDBReadApi):
         self._readApi = readApi
 
     def shutdown(self):
         self._readApi = None
+        self._liveDbController = None
 
     @inlineCallbacks
     def importLiveDbItems(
@@ -31,39 +100,429 @@ class LiveDbImportController:
     ) -> Deferred:
         """Import Live DB Items
 
-        1) set the  coordSetId
+        1) Split the items into chunks as they are read, and import the chunks in
+            parallel
+
+        2) For each chunk, insert the new items, update the dataType and importHash
+            of the existing items
 
-        2) Drop all disps with matching importGroupHash
+        3) For each chunk, update the resident values from the rows the worker
+            returns, and notify the observers of the new items
+
+        The chunks are committed separately, if a chunk fails, the chunks that
+        succeeded remain imported.
 
         :param modelSetKey: The name of the model set
         :param newItems: The items to add or update to the live db
         :return:
         """
+        try:
+            itemCount, insertedCount, updatedCount = yield self._importChunks(
+                modelSetKey, newItems
+            )
+
+        except Exception as e:
+            self._adminStatusController.status.importLastError = str(e)
+            self._adminStatusController.notify()
+            raise
 
-        newKeys = yield importLiveDbItems.delay(
-            modelSetKey=modelSetKey, newItems=newItems
+        logger.info(
+            "Imported %s LiveDbItems for %s, inserted %s, updated %s",
+            itemCount,
+            modelSetKey,
+            insertedCount,
+            updatedCount,
         )
 
-        newTuples = []
+    @inlineCallbacks
+    def _importChunks(
+        self, modelSetKey: str, newItems: Iterable[ImportLiveDbItemTuple]
+    ) -> Deferred:
+        """Import Chunks
+
+        Split the items into chunks of IMPORT_CHUNK_SIZE unique keys, and start each
+        chunk when the import semaphore allows it. The next chunk is only read once
+        there is room for it, so only the chunks in progress are held in memory.
+
+        The chunks are imported in parallel, a key that is in a chunk still in
+        progress is imported after that chunk has finished, so the last item for a
+        key wins.
+
+        :return: (itemCount, insertedCount, updatedCount)
+        """
+        # The deferred of the chunk in progress that each key is in
+        chunkDeferredByKey: Dict[str, Deferred] = {}
+
+        deferreds = []
+        itemCount = 0
+
+        chunkItemsByKey = {}
+        waitFor = set()
+
+        for item in newItems:
+            inProgressDeferred = chunkDeferredByKey.get(item.key)
+            if inProgressDeferred is not None:
+                waitFor.add(inProgressDeferred)
+
+            chunkItemsByKey[item.key] = item
+
+            if len(chunkItemsByKey) == self.IMPORT_CHUNK_SIZE:
+                itemCount += len(chunkItemsByKey)
+                started = yield self._startImportChunk(
+                    modelSetKey, chunkItemsByKey, waitFor, chunkDeferredByKey
+                )
+                deferreds.extend(started)
+                chunkItemsByKey = {}
+                waitFor = set()
 
-        deferredGenerator = self._readApi.bulkLoadDeferredGenerator(
-            modelSetKey, keyList=newKeys
+        if chunkItemsByKey:
+            itemCount += len(chunkItemsByKey)
+            started = yield self._startImportChunk(
+                modelSetKey, chunkItemsByKey, waitFor, chunkDeferredByKey
+            )
+            deferreds.extend(started)
+
+        results = yield gatherResults(deferreds, consumeErrors=True)
+
+        return (
+            itemCount,
+            sum([r[0] for r in results]),
+            sum([r[1] for r in results]),
         )
-        while True:
-            d = next(deferredGenerator)
-            result = yield d  # List[LiveDbDisplayValueTuple]
 
-            # The end of the list is marked my an empty result
-            if not result or not result.count:
+    @inlineCallbacks
+    def _startImportChunk(
+        self,
+        modelSetKey: str,
+        chunkItemsByKey: Dict[str, ImportLiveDbItemTuple],
+        waitFor: Set[Deferred],
+        chunkDeferredByKey: Dict[str, Deferred],
+    ) -> Deferred:
+        """Start Import Chunk
+
+        :return: A deferred that fires when the chunk has started, with the
+            deferred of the chunk, wrapped in a list so it isn't chained.
+        """
+        status = self._adminStatusController.status
+        status.importItemsInProgress += len(chunkItemsByKey)
+        self._adminStatusController.notify()
+
+        # Their errors are reported by the gatherResults of the import. Wait before
+        # taking a permit, so a waiting chunk doesn't hold one.
+        if waitFor:
+            yield DeferredList(list(waitFor))
+
+        yield self._importSemaphore.acquire()
+
+        keys = list(chunkItemsByKey)
+        d = self._importChunk(modelSetKey, list(chunkItemsByKey.values()))
+
+        if not d.called:
+            for key in keys:
+                chunkDeferredByKey[key] = d
+
+        def finished(result):
+            self._importSemaphore.release()
+            for key in keys:
+                if chunkDeferredByKey.get(key) is d:
+                    del chunkDeferredByKey[key]
+            return result
+
+        d.addBoth(finished)
+        return [d]
+
+    @inlineCallbacks
+    def _importChunk(
+        self, modelSetKey: str, chunk: List[ImportLiveDbItemTuple]
+    ) -> Deferred:
+        try:
+            newRows, updatedRows = yield importLiveDbItems.delay(
+                modelSetKey=modelSetKey, newItems=chunk, encodeRows=True
+            )
+
+        finally:
+            status = self._adminStatusController.status
+            status.importItemsInProgress -= len(chunk)
+            status.importItemsProcessedTotal += len(chunk)
+            self._adminStatusController.notify()
+
+        newRows = decodeDisplayValueRows(newRows)
+        updatedRows = decodeDisplayValueRows(updatedRows)
+        yield self._applyImportedRows(modelSetKey, newRows, updatedRows)
+
+        return len(newRows), len(updatedRows)
+
+    @inlineCallbacks
+    def importLiveDbItemGroups(
+        self,
+        modelSetKey: str,
+        newItemsByImportHash: Dict[str, List[ImportLiveDbItemTuple]],
+    ) -> Deferred:
+        """Import Live DB Item Groups
+
+        1) Hash the content of each group, skip the groups with a stored hash that
+            matches
+
+        2) Import each changed group in parallel, in one worker task per group,
+            this inserts, updates and deletes the vanished items of the group.
+            Large groups are upserted in chunks, then a last task deletes the
+            vanished items, their content hash is only stored by that task.
+
+        3) For each group, update the resident values, and notify the observers of
+            the new and deleted items
+
+        :param modelSetKey: The name of the model set
+        :param newItemsByImportHash: All the items of each group, by importHash
+        :return: The number of groups that were imported
+        """
+        if not newItemsByImportHash:
+            return 0
+
+        seenKeys = set()
+        for importHash, items in newItemsByImportHash.items():
+            for item in items:
+                if item.importHash != importHash:
+                    raise ValueError(
+                        "Item %s has importHash %s, it's in group %s"
+                        % (item.key, item.importHash, importHash)
+                    )
+                if item.key in seenKeys:
+                    raise ValueError("Item %s is in more than one group" % item.key)
+                seenKeys.add(item.key)
+
+        contentHashByImportHash = {
+            importHash: self._makeContentHash(items)
+            for importHash, items in newItemsByImportHash.items()
+        }
+
+        storedContentHashByImportHash = yield self._loadGroupContentHashes(
+            modelSetKey, list(contentHashByImportHash)
+        )
+
+        changedImportHashes = [
+            importHash
+            for importHash, contentHash in contentHashByImportHash.items()
+            if storedContentHashByImportHash.get(importHash) != contentHash
+        ]
+
+        # The chunks of large groups are counted as they start
+        status = self._adminStatusController.status
+        status.importItemsInProgress += sum(
+            [
+                len(newItemsByImportHash[h])
+                for h in changedImportHashes
+                if len(newItemsByImportHash[h]) <= self.IMPORT_CHUNK_SIZE
+            ]
+        )
+        self._adminStatusController.notify()
+
+        deferreds = []
+        for importHash in changedImportHashes:
+            items = newItemsByImportHash[importHash]
+            contentHash = contentHashByImportHash[importHash]
+
+            # The chunks of a large group take their own turns with the semaphore
+            if len(items) > self.IMPORT_CHUNK_SIZE:
+                d = self._importLargeGroup(modelSetKey, importHash, contentHash, items)
+            else:
+                d = self._importSemaphore.run(
+                    self._importGroup, modelSetKey, importHash, contentHash, items
+                )
+            deferreds.append(d)
+
+        try:
+            results = yield gatherResults(deferreds, consumeErrors=True)
+
+        except Exception as e:
+            status.importLastError = str(e)
+            self._adminStatusController.notify()
+            raise
+
+        logger.info(
+            "Imported %s of %s LiveDbItem groups for %s,"
+            " inserted %s, updated %s, deleted %s",
+            len(changedImportHashes),
+            len(newItemsByImportHash),
+            modelSetKey,
+            sum([r[0] for r in results]),
+            sum([r[1] for r in results]),
+            sum([r[2] for r in results]),
+        )
+
+        return len(changedImportHashes)
+
+    @inlineCallbacks
+    def _importGroup(
+        self,
+        modelSetKey: str,
+        importHash: str,
+        contentHash: str,
+        items: List[ImportLiveDbItemTuple],
+    ) -> Deferred:
+        try:
+            newRows, updatedRows, deletedKeys = yield importLiveDbItemGroup.delay(
+                modelSetKey=modelSetKey,
+                importHash=importHash,
+                contentHash=contentHash,
+                newItems=items,
+                encodeRows=True,
+            )
+
+        finally:
+            status = self._adminStatusController.status
+            status.importItemsInProgress -= len(items)
+            status.importItemsProcessedTotal += len(items)
+            self._adminStatusController.notify()
+
+        self._notifyDeletions(modelSetKey, deletedKeys)
+
+        newRows = decodeDisplayValueRows(newRows)
+        updatedRows = decodeDisplayValueRows(updatedRows)
+        yield self._applyImportedRows(modelSetKey, newRows, updatedRows)
+
+        return len(newRows), len(updatedRows), len(deletedKeys)
+
+    @inlineCallbacks
+    def _importLargeGroup(
+        self,
+        modelSetKey: str,
+        importHash: str,
+        contentHash: str,
+        items: List[ImportLiveDbItemTuple],
+    ) -> Deferred:
+        itemCount, insertedCount, updatedCount = yield self._importChunks(
+            modelSetKey, items
+        )
+
+        deletedKeys = yield self._importSemaphore.run(
+            finishLiveDbItemGroupImport.delay,
+            modelSetKey=modelSetKey,
+            importHash=importHash,
+            contentHash=contentHash,
+            keys=[i.key for i in items],
+        )
+
+        self._notifyDeletions(modelSetKey, deletedKeys)
+
+        return insertedCount, updatedCount, len(deletedKeys)
+
+    @staticmethod
+    def _makeContentHash(items: List[ImportLiveDbItemTuple]) -> str:
+        """Make Content Hash
+
+        The import only updates the dataType of existing items, so the hash is of
+        the keys and their dataTypes.
+
+        """
+        hasher = hashlib.sha256()
+        for item in sorted(items, key=lambda i: i.key):
+            hasher.update(("%s\t%s\n" % (item.key, item.dataType)).encode())
+        return hasher.hexdigest()
+
+    @deferToThreadWrapWithLogger(logger)
+    def _loadGroupContentHashes(
+        self, modelSetKey: str, importHashes: List[str]
+    ) -> Dict[str, str]:
+        table = LiveDbImportGroup.__table__
+
+        session = self._dbSessionCreator()
+        try:
+            modelSet = getOrCreateLiveDbModelSet(session, modelSetKey)
+            result = session.execute(
+                select([table.c.importHash, table.c.contentHash])
+                .where(table.c.modelSetId == modelSet.id)
+                .where(table.c.importHash.in_(importHashes))
+            )
+            return dict(result.fetchall())
+
+        finally:
+            session.close()
+
+    @inlineCallbacks
+    def _applyImportedRows(
+        self, modelSetKey: str, newRows: List[list], updatedRows: List[list]
+    ) -> Deferred:
+        if updatedRows:
+            self._liveDbController.updateDataTypes(
+                modelSetKey, self._makeDisplayValueTuples(updatedRows)
+            )
+
+        for start in range(0, len(newRows), self._additionsChunkSize):
+            # Let the reactor process other events between each chunk
+            if start:
+                yield deferLater(reactor, 0, lambda: None)
+
+            newTuples = self._makeDisplayValueTuples(
+                newRows[start : start + self._additionsChunkSize]
+            )
+            self._liveDbController.addItems(modelSetKey, newTuples)
+
+            # Notify the agent of the new keys.
+            self._readApi.itemAdditionsObservable(modelSetKey).on_next(newTuples)
+
+    @staticmethod
+    def _makeDisplayValueTuples(rows: List[list]) -> List[LiveDbDisplayValueTuple]:
+        return [
+            LiveDbDisplayValueTuple(
+                key=key, dataType=dataType, rawValue=rawValue, displayValue=displayValue
+            )
+            for key, dataType, rawValue, displayValue in rows
+        ]
+
+    @inlineCallbacks
+    def deleteLiveDbItems(self, modelSetKey: str, keys: List[str]) -> Deferred:
+        """Delete Live DB Items
+
+        Delete the items in chunks, the deleted keys of each chunk are emitted on
+        the deletions observable.
+
+        :param modelSetKey: The name of the model set
+        :param keys: The keys of the items to delete
+        :return: The number of items deleted
+        """
+        keys = list(set(keys))
+
+        total = 0
+        for start in range(0, len(keys), self.DELETE_CHUNK_SIZE):
+            deletedKeys = yield deleteLiveDbItems.delay(
+                modelSetKey=modelSetKey,
+                keys=keys[start : start + self.DELETE_CHUNK_SIZE],
+            )
+            total += len(deletedKeys)
+            self._notifyDeletions(modelSetKey, deletedKeys)
+
+        return total
+
+    @inlineCallbacks
+    def deleteLiveDbItemsByImportHash(
+        self, modelSetKey: str, importHash: str
+    ) -> Deferred:
+        """Delete Live DB Items By Import Hash
+
+        :param modelSetKey: The name of the model set
+        :param importHash: The import hash of the items to delete
+        :return: The number of items deleted
+        """
+        total = 0
+        while True:
+            deletedKeys = yield deleteLiveDbItemsByImportHash.delay(
+                modelSetKey=modelSetKey,
+                importHash=importHash,
+                chunkSize=self.DELETE_CHUNK_SIZE,
+            )
+            if not deletedKeys:
                 break
 
-            payload = yield Payload().fromEncodedPayloadDefer(result.encodedPayload)
+            total += len(deletedKeys)
+            self._notifyDeletions(modelSetKey, deletedKeys)
 
-            newTuples += payload.tuples
+        return total
 
-        # If there are no tuples, do nothing
-        if not newTuples:
+    def _notifyDeletions(self, modelSetKey: str, deletedKeys: List[str]) -> None:
+        if not deletedKeys:
             return
 
-        # Notify the agent of the new keys.
-        self._readApi.itemAdditionsObservable(modelSetKey).on_next(newTuples)
+        self._liveDbController.deleteItems(modelSetKey, deletedKeys)
+
+        # Notify the agent of the deleted keys.
+        self._readApi.itemDeletionsObservable(modelSetKey).on_next(deletedKeys)
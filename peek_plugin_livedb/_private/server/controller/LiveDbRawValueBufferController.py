@@ -0,0 +1,212 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pytz
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, inlineCallbacks
+from vortex.DeferUtil import vortexLogFailure
+
+from peek_plugin_livedb._private.server.controller.AdminStatusController import (
+    AdminStatusController,
+)
+from peek_plugin_livedb._private.server.controller.LiveDbValueUpdateQueueController import (
+    LiveDbValueUpdateQueueController,
+)
+from peek_plugin_livedb.tuples.LiveDbRawValueUpdateTuple import (
+    LiveDbRawValueUpdateTuple,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LiveDbRawValueBufferController:
+    """LiveDB Raw Value Buffer Controller
+
+    This controller sits in front of the queue controller and coalesces raw value
+    updates by (modelSetKey, key), the last value written wins.
+
+    The buffer is flushed to the queue as one transaction, when it has received
+    FLUSH_MAX_ITEMS updates, or FLUSH_PERIOD_SECONDS after the first update was
+    buffered, which ever comes first.
+
+    The deferreds returned from bufferRawValues fire when the flush that contains
+    their updates has been committed. On shutdown, the buffer is queued after the
+    flush in progress, the deferred returned from shutdown fires when it has been.
+
+    """
+
+    FLUSH_PERIOD_SECONDS = 0.250
+    FLUSH_MAX_ITEMS = 20000
+
+    def __init__(
+        self,
+        queueController: LiveDbValueUpdateQueueController,
+        adminStatusController: AdminStatusController,
+    ):
+        self._queueController = queueController
+        self._adminStatusController = adminStatusController
+
+        self._rawValuesByModelSetKey: Dict[str, Dict[str, str]] = defaultdict(dict)
+        self._receivedCount = 0
+        self._firstReceivedDate = None
+        self._waitingDeferreds: List[Deferred] = []
+
+        self._flushCall = None
+        self._flushInProgress = False
+        self._flushDeferred = None
+        self._isShutdown = False
+
+        self._receivedTotal = 0
+        self._queuedTotal = 0
+
+    @inlineCallbacks
+    def shutdown(self) -> Deferred:
+        """Shutdown
+
+        Queue the buffered values, this must be shutdown before the queue
+        controller.
+
+        """
+        self._isShutdown = True
+
+        if self._flushCall and self._flushCall.active():
+            self._flushCall.cancel()
+        self._flushCall = None
+
+        # The buffered values must be queued after the values being flushed, or
+        # they would be applied before the older values.
+        if self._flushDeferred:
+            yield self._flushDeferred
+
+        if self._waitingDeferreds:
+            yield self._flush()
+
+    def bufferRawValues(
+        self, modelSetKey: str, updates: List[LiveDbRawValueUpdateTuple]
+    ) -> Deferred:
+        if not self._receivedCount:
+            self._firstReceivedDate = datetime.now(pytz.utc)
+
+        rawValues = self._rawValuesByModelSetKey[modelSetKey]
+        for update in updates:
+            rawValues[update.key] = update.rawValue
+
+        self._receivedCount += len(updates)
+
+        d = Deferred()
+        self._waitingDeferreds.append(d)
+
+        if self._receivedCount >= self.FLUSH_MAX_ITEMS:
+            self._scheduleFlush(0)
+        else:
+            self._scheduleFlush(self.FLUSH_PERIOD_SECONDS)
+
+        return d
+
+    def _scheduleFlush(self, delay: float) -> None:
+        # A flush in progress will reschedule when it's finished
+        if self._flushInProgress:
+            return
+
+        if self._flushCall and self._flushCall.active():
+            if delay:
+                return
+            self._flushCall.cancel()
+
+        self._flushCall = reactor.callLater(delay, self._flush)
+
+    def _flush(self) -> Optional[Deferred]:
+        self._flushCall = None
+        if not self._waitingDeferreds:
+            return None
+
+        self._flushInProgress = True
+
+        rawValuesByModelSetKey = self._rawValuesByModelSetKey
+        receivedCount = self._receivedCount
+        firstReceivedDate = self._firstReceivedDate
+        waitingDeferreds = self._waitingDeferreds
+
+        self._rawValuesByModelSetKey = defaultdict(dict)
+        self._receivedCount = 0
+        self._waitingDeferreds = []
+
+        d = self._flushBuffered(
+            rawValuesByModelSetKey, receivedCount, firstReceivedDate
+        )
+
+        def callbackWaiting(_):
+            for waiting in waitingDeferreds:
+                waiting.callback(True)
+
+        def errbackWaiting(failure):
+            for waiting in waitingDeferreds:
+                waiting.errback(failure)
+
+        def flushFinished(_):
+            self._flushInProgress = False
+            self._flushDeferred = None
+
+            # shutdown queues the rest
+            if self._isShutdown:
+                return
+
+            if self._waitingDeferreds:
+                self._scheduleFlush(
+                    0
+                    if self._receivedCount >= self.FLUSH_MAX_ITEMS
+                    else self.FLUSH_PERIOD_SECONDS
+                )
+
+        d.addCallbacks(callbackWaiting, errbackWaiting)
+        d.addBoth(flushFinished)
+        d.addErrback(vortexLogFailure, logger, consumeError=True)
+
+        self._flushDeferred = d
+        return d
+
+    @inlineCallbacks
+    def _flushBuffered(
+        self,
+        rawValuesByModelSetKey: Dict[str, Dict[str, str]],
+        receivedCount: int,
+        firstReceivedDate: datetime,
+    ) -> Deferred:
+        updatesByModelSetKey = self._makeUpdatesByModelSetKey(rawValuesByModelSetKey)
+        queuedCount = sum([len(u) for u in updatesByModelSetKey.values()])
+
+        # The updates are stamped with the time the oldest of them was received
+        yield self._queueController.queueDataByModelSet(
+            updatesByModelSetKey, int(firstReceivedDate.timestamp() * 1000)
+        )
+
+        self._receivedTotal += receivedCount
+        self._queuedTotal += queuedCount
+
+        # The latency is how long the oldest update in the flush was buffered for
+        status = self._adminStatusController.status
+        status.rawValueBufferFlushLatencyMs = int(
+            (datetime.now(pytz.utc) - firstReceivedDate).total_seconds() * 1000
+        )
+        status.rawValueBufferCoalescingRatio = round(
+            self._receivedTotal / max(self._queuedTotal, 1), 2
+        )
+        self._adminStatusController.notify()
+
+        logger.debug(
+            "Flushed %s raw values, coalesced from %s", queuedCount, receivedCount
+        )
+
+    @staticmethod
+    def _makeUpdatesByModelSetKey(
+        rawValuesByModelSetKey: Dict[str, Dict[str, str]]
+    ) -> Dict[str, List[LiveDbRawValueUpdateTuple]]:
+        return {
+            modelSetKey: [
+                LiveDbRawValueUpdateTuple(key=key, rawValue=rawValue)
+                for key, rawValue in rawValues.items()
+            ]
+            for modelSetKey, rawValues in rawValuesByModelSetKey.items()
+        }
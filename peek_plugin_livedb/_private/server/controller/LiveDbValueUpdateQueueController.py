@@ -1,5 +1,10 @@
 import logging
-from typing import List
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+import pytz
 
 from peek_abstract_chunked_index.private.server.controller.ACIProcessorQueueControllerABC import (
     ACIProcessorQueueControllerABC,
@@ -14,13 +19,39 @@ from peek_abstract_chunked_index.private.tuples.ACIProcessorQueueTupleABC import
 from peek_plugin_livedb._private.server.controller.AdminStatusController import (
     AdminStatusController,
 )
+from peek_plugin_livedb._private.server.LiveDBReadApi import LiveDBReadApi
+from peek_plugin_livedb._private.server.controller.LiveDbController import (
+    LiveDbController,
+)
+from peek_plugin_livedb._private.server.controller.UpdateLatencyController import (
+    UpdateLatencyController,
+)
 from peek_plugin_livedb._private.storage.LiveDbItem import LiveDbItem
 from peek_plugin_livedb._private.storage.LiveDbModelSet import getOrCreateLiveDbModelSet
-from peek_plugin_livedb._private.storage.LiveDbRawValueQueue import LiveDbRawValueQueue
+from peek_plugin_livedb._private.storage.LiveDbRawValuePending import (
+    LiveDbRawValuePending,
+    upsertRawValuePendingRows,
+)
+from peek_plugin_livedb._private.storage.LiveDbRawValueQueue import (
+    LiveDbRawValueQueue,
+    copyRawValueQueueRows,
+    insertRawValueQueueRows,
+)
+from peek_plugin_livedb.tuples.LiveDbDisplayValueTuple import (
+    LiveDbDisplayValueTuple,
+)
 from peek_plugin_livedb.tuples.LiveDbRawValueUpdateTuple import (
     LiveDbRawValueUpdateTuple,
 )
-from vortex.DeferUtil import deferToThreadWrapWithLogger
+from peek_plugin_base.storage.RunPyInPg import runPyInPg
+from sqlalchemy import asc, literal_column, select, text
+from sqlalchemy.dialects import postgresql
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+from twisted.internet.interfaces import IReadDescriptor
+from vortex.DeferUtil import deferToThreadWrapWithLogger, vortexLogFailure
+from vortex.Payload import Payload
+from zope.interface import implementer
 
 logger = logging.getLogger(__name__)
 
@@ -43,7 +74,94 @@ class _Notifier(ACIProcessorStatusNotifierABC):
         self._adminStatusController.notify()
 
 
+def _shardSql(shardCount: int) -> str:
+    # The shard is computed by PostgreSQL, so the fetch can skip the full shards
+    return (
+        """mod(hashtext(CAST("modelSetId" AS TEXT) || ':' || "key") & 2147483647, %s)"""
+        % shardCount
+    )
+
+
+class _PgRow:
+    """Turn a plpy row["val"] into a row.val"""
+
+    def __init__(self, row):
+        self._row = row
+
+    def __getattr__(self, name):
+        return self._row[name]
+
+
+@implementer(IReadDescriptor)
+class _QueueNotifyReader:
+    """Queue Notify Reader
+
+    Watches the socket of a psycopg2 connection that is LISTENing to the queue
+    channel, and calls onNotify when a NOTIFY arrives.
+
+    """
+
+    def __init__(self, connection, onNotify, onLost):
+        self._connection = connection
+        self._onNotify = onNotify
+        self._onLost = onLost
+
+    def fileno(self):
+        return self._connection.fileno()
+
+    def logPrefix(self):
+        return self.__class__.__name__
+
+    def doRead(self):
+        self._connection.poll()
+        if self._connection.notifies:
+            # Any number of notifies just means, look at the queue
+            del self._connection.notifies[:]
+            self._onNotify()
+
+    def connectionLost(self, reason):
+        self._onLost(reason)
+
+    def close(self):
+        try:
+            self._connection.close()
+        except Exception as e:
+            logger.debug("Closing the queue LISTEN connection failed: %s", e)
+
+
 class LiveDbValueUpdateQueueController(ACIProcessorQueueControllerABC):
+    """LiveDB Value Update Queue Controller
+
+    This controller queues raw value updates in the append only
+    LiveDbRawValueQueue table, and deduplicates the queue before it fetches blocks.
+
+    With adaptive sizing, the block size, the number of blocks in flight and the
+    poll period are tuned after each fetch, see _adaptSizing.
+
+    With sharding, the queue is split into shardCount shards by
+    hashtext(modelSetId:key), each block holds the items of one shard, and each shard
+    has at most one block in flight. So two updates for a key are never written by
+    workers at the same time, or out of order, see _fetchShardedBlocks.
+
+    Adaptive sizing and sharding rely on the private behaviour of
+    ACIProcessorQueueControllerABC, as of peek-abstract-chunked-index 3.4.16,
+    pyproject.toml pins it to 3.4. Each place that relies on it says what it
+    assumes, check them when the dependency is upgraded.
+
+    When it has a dbEngine, the controller LISTENs on QUEUE_NOTIFY_CHANNEL, which
+    queueDataByModelSet NOTIFYs when it commits. A notify polls the queue straight
+    away, at most once every NOTIFY_MIN_POLL_PERIOD_SECONDS, and an idle controller
+    only polls every NOTIFY_IDLE_POLL_PERIOD_SECONDS, in case a notify is missed.
+
+    PostgreSQL serialises the commits of transactions that NOTIFY, with a database
+    wide lock. queueDataByModelSet is called by the raw value buffer, one flush at a
+    time, so that costs nothing. queueData is called concurrently when the buffer is
+    disabled, so it doesn't NOTIFY, it wakes this controller up directly when it
+    has committed. Enable the raw value buffer to have the queue written by one
+    NOTIFYing transaction at a time.
+
+    """
+
     # Prioritize the livedb updater.
     MAX_CPU_PERCENTAGE = 85.00
 
@@ -55,26 +173,669 @@ class LiveDbValueUpdateQueueController(ACIProcessorQueueControllerABC):
 
     WORKER_TASK_TIMEOUT = 60.0
 
+    #: Batches of at least this many updates are queued with COPY
+    QUEUE_COPY_MIN_ROWS = 200
+
+    #: The limits of adaptive sizing
+    ADAPTIVE_ITEMS_PER_TASK_MIN = 50
+    ADAPTIVE_ITEMS_PER_TASK_MAX = 5000
+    ADAPTIVE_BLOCKS_MAX = 40
+    ADAPTIVE_POLL_PERIOD_MIN_SECONDS = 0.020
+
+    #: Adaptive sizing keeps the expected worker task time under this fraction of
+    #: WORKER_TASK_TIMEOUT
+    ADAPTIVE_TIMEOUT_HEADROOM = 0.25
+
+    #: Adaptive sizing only halves the blocks after this many fetches in a row
+    #: without a backlog
+    ADAPTIVE_SHRINK_AFTER_FETCHES = 5
+
+    #: The most items one poll fetches, and the most items in the buffer, which are
+    #: excluded by the fetch query
+    QUEUE_FETCH_MAX_ITEMS = 20000
+    QUEUE_BUFFER_MAX_ITEMS = 50000
+
+    #: Sharding fetches ahead, up to this many blocks per shard, including the block
+    #: in flight
+    SHARD_PENDING_BLOCKS = 2
+
+    #: queueData NOTIFYs this channel when updates are queued
+    QUEUE_NOTIFY_CHANNEL = "pl_livedb_raw_value_queue"
+
+    #: NOTIFYs poll the queue at most this often, a burst of them is one poll
+    NOTIFY_MIN_POLL_PERIOD_SECONDS = ADAPTIVE_POLL_PERIOD_MIN_SECONDS
+
+    #: The poll period of an idle queue, while the controller is LISTENing
+    NOTIFY_IDLE_POLL_PERIOD_SECONDS = 5.0
+
+    #: How long to wait before trying to LISTEN again, after the connection fails
+    NOTIFY_RETRY_SECONDS = 30.0
+
     _logger = logger
     _QueueDeclarative: ACIProcessorQueueTupleABC = LiveDbRawValueQueue
     _VacuumDeclaratives = (LiveDbRawValueQueue, LiveDbItem)
 
-    def __init__(self, ormSessionCreator, adminStatusController: AdminStatusController):
+    def __init__(
+        self,
+        ormSessionCreator,
+        adminStatusController: AdminStatusController,
+        liveDbController: LiveDbController,
+        adaptiveSizing: bool = False,
+        shardCount: int = 0,
+        dbEngine=None,
+        updateLatencyController: Optional[UpdateLatencyController] = None,
+    ):
         ACIProcessorQueueControllerABC.__init__(
             self, ormSessionCreator, _Notifier(adminStatusController)
         )
+        self._adminStatusController = adminStatusController
+        self._liveDbController = liveDbController
+        self._updateLatencyController = updateLatencyController
+        self._readApi = None
+
+        self._adaptiveSizing = adaptiveSizing
+        self._itemsPerTask = self.QUEUE_ITEMS_PER_TASK
+        self._pollPeriod = self.POLL_PERIOD_SECONDS
+        self._secondsPerItem: Optional[float] = None
+        self._quietFetchCount = 0
+
+        self._shardCount = shardCount
+        self._pendingBlocksByShard: Dict[
+            int, Deque[ACIProcessorQueueBlockItem]
+        ] = defaultdict(deque)
+        self._shardsInFlight = set()
+
+        # The shard of each block, by the first queue id of the block
+        self._shardByBlockId: Dict[int, int] = {}
+
+        # There is one block in flight per shard, top the shards up as soon as one
+        # is free.
+        # ASSUMES: ACIProcessorQueueControllerABC._poll reads QUEUE_BLOCKS_MAX and
+        # QUEUE_BLOCKS_MIN from self, so an instance attribute overrides the class.
+        if shardCount:
+            self.QUEUE_BLOCKS_MAX = shardCount
+            self.QUEUE_BLOCKS_MIN = shardCount - 1
+
+        self._dbEngine = dbEngine
+        self._notifyReader: Optional[_QueueNotifyReader] = None
+        self._notifyRetryCall = None
+        self._pollRunning = False
+        self._wakeupPending = False
+        self._wakeupCall = None
+        self._lastPollSeconds = 0.0
+
+        self._notifySizing()
+
+    def setReadApi(self, readApi: LiveDBReadApi):
+        self._readApi = readApi
+
+    def start(self):
+        ACIProcessorQueueControllerABC.start(self)
+        if self._dbEngine:
+            d = self._startListening()
+            d.addErrback(vortexLogFailure, logger)
+
+    def shutdown(self):
+        self._stopListening()
+        if self._wakeupCall and self._wakeupCall.active():
+            self._wakeupCall.cancel()
+        self._wakeupCall = None
+        ACIProcessorQueueControllerABC.shutdown(self)
+        self._readApi = None
+        self._liveDbController = None
+        self._updateLatencyController = None
+        self._dbEngine = None
+
+    # ---------------
+    # Poll methods
+
+    @inlineCallbacks
+    def _poll(self):
+        """Poll
+
+        Both the LoopingCall and a NOTIFY call this, only one poll runs at a time, a
+        NOTIFY during a poll polls again after it.
+
+        """
+        if self._pollRunning:
+            return
+
+        self._pollRunning = True
+        self._lastPollSeconds = reactor.seconds()
+        try:
+            yield ACIProcessorQueueControllerABC._poll(self)
+
+        finally:
+            self._pollRunning = False
+
+        isIdle = (
+            not self._queueCount
+            and not self._fetchedBlockBuffer
+            and not self._pendingBlocksByShard
+        )
+
+        if isIdle and self._notifyReader:
+            self._setPollInterval(self.NOTIFY_IDLE_POLL_PERIOD_SECONDS)
+        else:
+            self._setPollInterval(self._pollPeriod)
+
+        if self._wakeupPending:
+            self._wakeupPending = False
+            reactor.callLater(0, self._wakeup)
+
+    def _wakeup(self):
+        # The controller hasn't been started, or it has been stopped
+        if not self._pollLoopingCall or not self._pollLoopingCall.running:
+            return
+
+        if self._pollRunning:
+            self._wakeupPending = True
+            return
+
+        # A poll is already scheduled for this burst of NOTIFYs
+        if self._wakeupCall and self._wakeupCall.active():
+            return
+
+        delaySeconds = (
+            self._lastPollSeconds + self.NOTIFY_MIN_POLL_PERIOD_SECONDS
+        ) - reactor.seconds()
+        if 0 < delaySeconds:
+            self._wakeupCall = reactor.callLater(delaySeconds, self._wakeup)
+            return
+
+        d = self._poll()
+        d.addErrback(vortexLogFailure, logger)
+
+    def _setPollInterval(self, seconds: float) -> None:
+        loopingCall = self._pollLoopingCall
+        if not loopingCall or loopingCall.interval == seconds:
+            return
+
+        loopingCall.interval = seconds
+
+        # Reschedule the next poll, if it's waiting for the old interval
+        if loopingCall.running:
+            loopingCall.reset()
+
+        self._adminStatusController.status.rawValueQueuePollPeriodMs = int(
+            seconds * 1000
+        )
+        self._adminStatusController.notify()
+
+    # ---------------
+    # LISTEN / NOTIFY methods
+
+    @inlineCallbacks
+    def _startListening(self):
+        self._notifyRetryCall = None
+
+        try:
+            connection = yield self._connectNotifyListener()
+
+        except Exception as e:
+            logger.warning(
+                "Failed to LISTEN for queued raw values, polling instead: %s", e
+            )
+            self._scheduleListenRetry()
+            return
+
+        # The controller was shutdown while we connected
+        if not self._dbEngine:
+            connection.close()
+            return
+
+        self._notifyReader = _QueueNotifyReader(
+            connection, self._wakeup, self._notifyListenLost
+        )
+        reactor.addReader(self._notifyReader)
+        logger.debug("Listening on %s", self.QUEUE_NOTIFY_CHANNEL)
+
+        # Catch any updates queued before we were listening
+        self._wakeup()
+
+    @deferToThreadWrapWithLogger(logger)
+    def _connectNotifyListener(self):
+        connection = self._dbEngine.raw_connection()
+
+        # This connection is held open to LISTEN, it never goes back to the pool
+        connection.detach()
+        dbapiConnection = connection.connection
+        dbapiConnection.rollback()
+        dbapiConnection.autocommit = True
+
+        cursor = dbapiConnection.cursor()
+        try:
+            cursor.execute('LISTEN "%s"' % self.QUEUE_NOTIFY_CHANNEL)
+
+        finally:
+            cursor.close()
+
+        return dbapiConnection
+
+    def _notifyListenLost(self, reason):
+        if not self._notifyReader:
+            return
+
+        logger.warning(
+            "Lost the LISTEN connection for queued raw values, polling instead: %s",
+            reason.getErrorMessage(),
+        )
+        self._notifyReader.close()
+        self._notifyReader = None
+        self._setPollInterval(self._pollPeriod)
+        self._scheduleListenRetry()
+
+    def _scheduleListenRetry(self):
+        if not self._dbEngine:
+            return
+
+        self._notifyRetryCall = reactor.callLater(
+            self.NOTIFY_RETRY_SECONDS, self._retryListening
+        )
+
+    def _retryListening(self):
+        d = self._startListening()
+        d.addErrback(vortexLogFailure, logger)
+
+    def _stopListening(self):
+        if self._notifyRetryCall and self._notifyRetryCall.active():
+            self._notifyRetryCall.cancel()
+        self._notifyRetryCall = None
+
+        if not self._notifyReader:
+            return
 
-        self._modelSetIdByKey = {}
+        reactor.removeReader(self._notifyReader)
+        self._notifyReader.close()
+        self._notifyReader = None
 
     def _sendToWorker(self, block: ACIProcessorQueueBlockItem):
         from peek_plugin_livedb._private.worker.tasks.LiveDbItemUpdateTask import (
             updateValues,
         )
 
-        return updateValues.delay(block.itemsEncodedPayload)
+        startTime = datetime.now(pytz.utc)
+        d = updateValues.delay(
+            block.itemsEncodedPayload, self._liveDbController.dataTypeGeneration
+        )
+        d.addCallback(self._recordTaskTime, startTime, len(block.queueIds))
+        return d
+
+    @inlineCallbacks
+    def _runWorkerTask(self, block: ACIProcessorQueueBlockItem):
+        """Run Worker Task
+
+        Free the shard of the block, once the block has been processed.
 
-    def _processWorkerResults(self, results):
-        pass
+        ASSUMES: ACIProcessorQueueControllerABC._runWorkerTask doesn't raise. On
+        success, it removes the queue ids of the block from self._queueIdsInBuffer,
+        after _processWorkerResults. On failure, it leaves them in the buffer and
+        calls self._runWorkerTask again later, with reactor.callLater.
+
+        """
+        yield ACIProcessorQueueControllerABC._runWorkerTask(self, block)
+
+        # A block that will be retried still has its ids in the buffer, its shard
+        # stays in flight until the retry succeeds.
+        blockId = block.queueIds[0]
+        if blockId in self._shardByBlockId and blockId not in self._queueIdsInBuffer:
+            self._shardsInFlight.discard(self._shardByBlockId.pop(blockId))
+
+    def _recordTaskTime(self, results, startTime: datetime, itemCount: int):
+        seconds = (datetime.now(pytz.utc) - startTime).total_seconds()
+
+        # A moving average of the worker time per item
+        secondsPerItem = seconds / max(itemCount, 1)
+        if self._secondsPerItem is None:
+            self._secondsPerItem = secondsPerItem
+        else:
+            self._secondsPerItem = 0.8 * self._secondsPerItem + 0.2 * secondsPerItem
+
+        self._adminStatusController.status.rawValueWorkerTaskMs = int(seconds * 1000)
+        self._adminStatusController.notify()
+
+        return results
+
+    def _processWorkerResults(self, results: list):
+        """Process Worker Results
+
+        Publish the display values the worker has written, one batch per model set
+        for each block, then record the latency of the block.
+
+        """
+        # The controller may have been shutdown while the worker was busy
+        if not results or not self._readApi:
+            return
+
+        displayValuesByModelSetKey, ingressTimesMs, startTimeMs, commitTimeMs = results
+
+        for modelSetKey, displayValues in displayValuesByModelSetKey.items():
+            tuples = [
+                LiveDbDisplayValueTuple(
+                    key=key,
+                    dataType=dataType,
+                    rawValue=rawValue,
+                    displayValue=displayValue,
+                )
+                for key, dataType, rawValue, displayValue in displayValues
+            ]
+
+            self._liveDbController.updateDisplayValues(modelSetKey, tuples)
+            self._readApi.displayValueUpdatesObservable(modelSetKey).on_next(tuples)
+
+        if self._updateLatencyController:
+            self._updateLatencyController.recordBlock(
+                ingressTimesMs, startTimeMs, commitTimeMs
+            )
+
+    # ---------------
+    # Adaptive sizing methods
+
+    def _fetchBlocks(self):
+        # ASSUMES: ACIProcessorQueueControllerABC._poll calls this, then dispatches
+        # the blocks in order, until it has QUEUE_BLOCKS_MAX in flight, or it finds a
+        # block with items in flight. The blocks it doesn't dispatch are kept in
+        # self._fetchedBlockBuffer for the next poll. The blocks are fetched the same
+        # as ACIProcessorQueueControllerABC._fetchBlocks, see _fetchQueueBlocks.
+        if self._shardCount:
+            return self._fetchShardedBlocks()
+
+        if self._adaptiveSizing:
+            return self._fetchSizedBlocks()
+
+        return ACIProcessorQueueControllerABC._fetchBlocks(self)
+
+    @inlineCallbacks
+    def _fetchSizedBlocks(self):
+        toGrab = max(self.QUEUE_BLOCKS_MAX - self._queueCount, 0) * self._itemsPerTask
+
+        shardBlocks = yield self._fetchQueueBlocks(toGrab)
+        return [block for _, block in shardBlocks]
+
+    @inlineCallbacks
+    def _fetchQueueBlocks(self, toGrab: int, shardRoom: Optional[List[int]] = None):
+        """Fetch Queue Blocks
+
+        Fetch up to toGrab queued items into blocks of self._itemsPerTask, this is
+        ACIProcessorQueueControllerABC._fetchBlocks with the sizes passed in.
+
+        The buffered ids are excluded by the query, before the LIMIT, so an item in
+        flight never takes the place of a new one.
+
+        :param shardRoom: With sharding, the number of items each shard has room for,
+            the shards with no room are excluded by the query.
+        :returns: A list of (shard, ACIProcessorQueueBlockItem), the shard is None
+            without sharding.
+        """
+        toGrab = min(
+            toGrab,
+            self.QUEUE_FETCH_MAX_ITEMS,
+            self.QUEUE_BUFFER_MAX_ITEMS - len(self._queueIdsInBuffer),
+        )
+        if toGrab <= 0:
+            return []
+
+        dedupSql = (
+            self._dedupeQueueSql(self._lastFetchedId, self.DEDUPE_LOOK_AHEAD_MIN_ROWS)
+            if self._lastFetchedId
+            else None
+        )
+
+        backlog, rawBlocks = yield runPyInPg(
+            self._logger,
+            self._dbSessionCreator,
+            self._fetchQueueBlocksInPg,
+            None,
+            list(self._queueIdsInBuffer),
+            toGrab,
+            dedupSql,
+            self._itemsPerTask,
+            shardRoom,
+        )
+
+        shardBlocks = []
+        fetchedCount = 0
+        for shard, queueIds, itemsEncodedPayload, itemUniqueIds in rawBlocks:
+            block = ACIProcessorQueueBlockItem(
+                queueIds, itemsEncodedPayload.encode(), set(itemUniqueIds)
+            )
+            shardBlocks.append((shard, block))
+            self._queueIdsInBuffer.update(queueIds)
+            fetchedCount += len(queueIds)
+
+        if self._queueIdsInBuffer:
+            self._lastFetchedId = max(self._queueIdsInBuffer)
+
+        if self._adaptiveSizing:
+            self._adaptSizing(fetchedCount, backlog)
+
+        return shardBlocks
+
+    @classmethod
+    def _fetchQueueBlocksInPg(
+        cls,
+        plpy,
+        queueIdsInBuffer: List[int],
+        toGrab: int,
+        dedupSql: Optional[str],
+        itemsPerTask: int,
+        shardRoom: Optional[List[int]],
+    ):
+        # ---------------
+        # Deduplicate the queue before we fetch more
+        if dedupSql:
+            plpy.execute(dedupSql)
+
+        queueTable = cls._QueueDeclarative.__table__
+
+        # One more row than we want tells us if there is a backlog
+        sql = (
+            select([queueTable])
+            .where(text('"id" NOT IN (SELECT unnest(CAST($1 AS BIGINT[])))'))
+            .order_by(asc(queueTable.c.id))
+            .limit(toGrab + 1)
+        )
+
+        if shardRoom is None:
+            # Without sharding, there is one shard with room for toGrab items
+            roomByShard = {None: toGrab}
+
+        else:
+            roomByShard = dict(enumerate(shardRoom))
+            shardCol = literal_column(_shardSql(len(shardRoom)))
+            sql = sql.add_columns(shardCol.label("shard")).where(
+                shardCol.in_([shard for shard, room in roomByShard.items() if room])
+            )
+
+        sqlQry = str(
+            sql.compile(
+                dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+            )
+        )
+        plan = plpy.prepare(sqlQry, ["bigint[]"])
+
+        # ---------------
+        # Load the queue items into their shards, in queue order, a row that a
+        # shard has no room for means there is a backlog
+        itemsByShard = defaultdict(list)
+        backlog = False
+
+        cursor = plpy.cursor(plan, [queueIdsInBuffer])
+        while True:
+            rows = cursor.fetch(1000)
+            if not rows:
+                break
+            for row in rows:
+                shard = None if shardRoom is None else row["shard"]
+                if not roomByShard[shard]:
+                    backlog = True
+                    continue
+
+                roomByShard[shard] -= 1
+                item = cls._QueueDeclarative.sqlCoreLoad(_PgRow(row))
+                itemsByShard[shard].append(item)
+
+        queueBlocks = []
+        for shard, shardItems in itemsByShard.items():
+            for queueIds, itemsEncodedPayload, itemUniqueIds in cls._makeQueueBlocks(
+                shardItems, itemsPerTask
+            ):
+                queueBlocks.append(
+                    (shard, queueIds, itemsEncodedPayload, itemUniqueIds)
+                )
+
+        return [backlog, queueBlocks]
+
+    @classmethod
+    def _makeQueueBlocks(cls, items: list, itemsPerTask: int) -> list:
+        """Make Queue Blocks
+
+        Split the items into blocks, the same as
+        ACIProcessorQueueControllerABC._fetchBlocksInPg. Only the last value of a
+        key is written, the blocks before it still delete their queue rows.
+
+        """
+        queueBlocks = []
+        addedUniqueKeys = set()
+
+        for start in reversed(range(0, len(items), itemsPerTask)):
+            blockItems = items[start : start + itemsPerTask]
+
+            itemsByUniqueKey = {}
+            for item in blockItems:
+                if item.ckiUniqueKey not in addedUniqueKeys:
+                    itemsByUniqueKey[item.ckiUniqueKey] = item
+            addedUniqueKeys.update(itemsByUniqueKey)
+
+            queueIds = [i.id for i in blockItems]
+            itemsEncodedPayload = Payload(
+                tuples=[list(itemsByUniqueKey.values()), queueIds]
+            ).toEncodedPayload()
+
+            queueBlocks.append((queueIds, itemsEncodedPayload, list(itemsByUniqueKey)))
+
+        queueBlocks.reverse()
+        return queueBlocks
+
+    def _adaptSizing(self, fetchedCount: int, backlog: bool) -> None:
+        """Adapt Sizing
+
+        When more items are queued than were fetched there is a backlog, the blocks
+        are doubled in size, up to the limit the worker can process well inside
+        WORKER_TASK_TIMEOUT, more blocks are kept in flight, and the poll period is
+        dropped to the minimum, so free slots are filled straight away.
+
+        Otherwise a fetch means the queue is quiet, the poll period is dropped to the
+        minimum, so updates are sent straight away. The blocks are halved in size
+        after ADAPTIVE_SHRINK_AFTER_FETCHES quiet fetches in a row, so a steady load
+        near the backlog doesn't swing the block size up and down.
+
+        An empty fetch means the queue is idle, the poll period is doubled, back up
+        to POLL_PERIOD_SECONDS.
+
+        """
+        cls = self.__class__
+        itemsPerTask = self._itemsPerTask
+
+        if backlog:
+            self._quietFetchCount = 0
+            itemsPerTask *= 2
+            blocksMax = self.ADAPTIVE_BLOCKS_MAX
+            self._pollPeriod = self.ADAPTIVE_POLL_PERIOD_MIN_SECONDS
+
+        elif fetchedCount:
+            self._quietFetchCount += 1
+            if self.ADAPTIVE_SHRINK_AFTER_FETCHES <= self._quietFetchCount:
+                self._quietFetchCount = 0
+                itemsPerTask //= 2
+                blocksMax = cls.QUEUE_BLOCKS_MAX
+            else:
+                blocksMax = self.QUEUE_BLOCKS_MAX
+            self._pollPeriod = self.ADAPTIVE_POLL_PERIOD_MIN_SECONDS
+
+        else:
+            blocksMax = cls.QUEUE_BLOCKS_MAX
+            self._pollPeriod = min(self._pollPeriod * 2, self.POLL_PERIOD_SECONDS)
+
+        if self._secondsPerItem:
+            itemsPerTask = min(
+                itemsPerTask,
+                int(
+                    self.WORKER_TASK_TIMEOUT
+                    * self.ADAPTIVE_TIMEOUT_HEADROOM
+                    / self._secondsPerItem
+                ),
+            )
+
+        self._itemsPerTask = max(
+            self.ADAPTIVE_ITEMS_PER_TASK_MIN,
+            min(itemsPerTask, self.ADAPTIVE_ITEMS_PER_TASK_MAX),
+        )
+
+        # ASSUMES: ACIProcessorQueueControllerABC._poll reads these from self,
+        # sharding sets them from the shard count
+        if not self._shardCount:
+            self.QUEUE_BLOCKS_MAX = blocksMax
+            self.QUEUE_BLOCKS_MIN = blocksMax // 4
+
+        # _poll sets the LoopingCall interval from self._pollPeriod
+        self._notifySizing()
+
+    # ---------------
+    # Sharding methods
+
+    @inlineCallbacks
+    def _fetchShardedBlocks(self):
+        """Fetch Sharded Blocks
+
+        Fetch the queue into per shard blocks, then give the base class the next
+        block of each shard that has no block in flight.
+
+        The blocks of each shard are kept in queue order, so a newer value for a key
+        is always written after an older one.
+
+        """
+        # Each shard has room for SHARD_PENDING_BLOCKS, so a busy shard can't fill
+        # the fetch and hold up the others
+        shardRoom = []
+        for shard in range(self._shardCount):
+            blockCount = len(self._pendingBlocksByShard.get(shard, ()))
+            if shard in self._shardsInFlight:
+                blockCount += 1
+
+            shardRoom.append(
+                max(self.SHARD_PENDING_BLOCKS - blockCount, 0) * self._itemsPerTask
+            )
+
+        shardBlocks = yield self._fetchQueueBlocks(sum(shardRoom), shardRoom)
+        for shard, block in shardBlocks:
+            self._pendingBlocksByShard[shard].append(block)
+            self._shardByBlockId[block.queueIds[0]] = shard
+
+        # ASSUMES: The base class dispatches all of these in this poll. There is a
+        # free slot in QUEUE_BLOCKS_MAX for each shard that isn't in flight, and the
+        # shards have no items in common. A block it keeps for the next poll still
+        # holds its shard, so the order of the shard is kept.
+        blocks = []
+        for shard in list(self._pendingBlocksByShard):
+            if shard in self._shardsInFlight:
+                continue
+
+            pendingBlocks = self._pendingBlocksByShard[shard]
+            blocks.append(pendingBlocks.popleft())
+            self._shardsInFlight.add(shard)
+
+            if not pendingBlocks:
+                del self._pendingBlocksByShard[shard]
+
+        return blocks
+
+    def _notifySizing(self) -> None:
+        status = self._adminStatusController.status
+        status.rawValueQueueItemsPerTask = self._itemsPerTask
+        status.rawValueQueueBlocksMax = self.QUEUE_BLOCKS_MAX
+        status.rawValueQueuePollPeriodMs = int(self._pollPeriod * 1000)
+        self._adminStatusController.notify()
 
     # ---------------
     # Deduplicate method
@@ -117,32 +878,217 @@ class LiveDbValueUpdateQueueController(ACIProcessorQueueControllerABC):
     # Insert into Queue methods
 
     @deferToThreadWrapWithLogger(logger)
-    def queueData(self, modelSetKey: str, updates: List[LiveDbRawValueUpdateTuple]):
+    def queueData(
+        self,
+        modelSetKey: str,
+        updates: List[LiveDbRawValueUpdateTuple],
+        ingressTimeMs: Optional[int] = None,
+    ):
+        """Queue Data
+
+        :param ingressTimeMs: When the updates were received, in milliseconds since
+            the epoch, defaults to now.
+
+        """
         if not updates:
             return
 
+        if ingressTimeMs is None:
+            ingressTimeMs = int(time.time() * 1000)
+
         ormSession = self._dbSessionCreator()
         try:
-            logger.debug("Queueing %s raw values for compile", len(updates))
+            self._queueDataInSession(ormSession, modelSetKey, updates, ingressTimeMs)
+            ormSession.commit()
 
-            if modelSetKey not in self._modelSetIdByKey:
-                modelSet = getOrCreateLiveDbModelSet(
-                    ormSession, modelSetKey=modelSetKey
-                )
-                self._modelSetIdByKey[modelSet.key] = modelSet.id
+        finally:
+            ormSession.close()
+
+        # Concurrent NOTIFYing commits are serialised, so wake up the controller
+        # without one, the queue is only written from this process.
+        reactor.callFromThread(self._wakeup)
+
+    @deferToThreadWrapWithLogger(logger)
+    def queueDataByModelSet(
+        self,
+        updatesByModelSetKey: Dict[str, List[LiveDbRawValueUpdateTuple]],
+        ingressTimeMs: Optional[int] = None,
+    ):
+        """Queue Data By Model Set
 
-            modelSetId = self._modelSetIdByKey[modelSetKey]
+        Queue the updates for multiple model sets in one transaction.
 
-            inserts = []
-            for update in updates:
-                inserts.append(
-                    dict(
-                        modelSetId=modelSetId, key=update.key, rawValue=update.rawValue
+        :param ingressTimeMs: See queueData
+
+        """
+        if ingressTimeMs is None:
+            ingressTimeMs = int(time.time() * 1000)
+
+        ormSession = self._dbSessionCreator()
+        try:
+            # In the same order every time, see upsertRawValuePendingRows
+            for modelSetKey, updates in sorted(updatesByModelSetKey.items()):
+                if updates:
+                    self._queueDataInSession(
+                        ormSession, modelSetKey, updates, ingressTimeMs
                     )
+
+            self._notifyQueued(ormSession)
+            ormSession.commit()
+
+        finally:
+            ormSession.close()
+
+    def _queueDataInSession(
+        self,
+        ormSession,
+        modelSetKey: str,
+        updates: List[LiveDbRawValueUpdateTuple],
+        ingressTimeMs: int,
+    ):
+        logger.debug("Queueing %s raw values for compile", len(updates))
+
+        modelSetId = getOrCreateLiveDbModelSet(ormSession, modelSetKey=modelSetKey).id
+
+        rows = [(modelSetId, u.key, u.rawValue, ingressTimeMs) for u in updates]
+        self._insertQueueRows(ormSession, rows)
+
+    def _notifyQueued(self, ormSession):
+        # PostgreSQL sends the NOTIFY when the transaction commits
+        ormSession.execute(text('NOTIFY "%s"' % self.QUEUE_NOTIFY_CHANNEL))
+
+    def _insertQueueRows(self, ormSession, rows: List[tuple]):
+        if len(rows) < self.QUEUE_COPY_MIN_ROWS:
+            insertRawValueQueueRows(ormSession, rows)
+        else:
+            copyRawValueQueueRows(ormSession, rows)
+
+    # ---------------
+    # Queue storage methods
+
+    @deferToThreadWrapWithLogger(logger)
+    def setQueueTablesUnlogged(self, unlogged: bool):
+        """Set Queue Tables Unlogged
+
+        Make both queue tables UNLOGGED, or LOGGED, this is called before the
+        controller is started.
+
+        Writes to an UNLOGGED table skip the WAL, the queue rows are short lived, so
+        this saves most of their write cost. PostgreSQL truncates UNLOGGED tables
+        after a crash, the queued updates are lost, and they aren't replicated.
+
+        Changing the mode rewrites the table, the rows are kept.
+
+        """
+        ormSession = self._dbSessionCreator()
+        try:
+            for Declarative in (LiveDbRawValueQueue, LiveDbRawValuePending):
+                tableName = '"pl_livedb"."%s"' % Declarative.__tablename__
+
+                relpersistence = ormSession.execute(
+                    text(
+                        "SELECT relpersistence FROM pg_class"
+                        " WHERE oid = CAST(:name AS regclass)"
+                    ),
+                    dict(name=tableName),
+                ).scalar()
+
+                # p = permanent, u = unlogged
+                if relpersistence == ("u" if unlogged else "p"):
+                    continue
+
+                ormSession.execute(
+                    text(
+                        "ALTER TABLE %s SET %s"
+                        % (tableName, "UNLOGGED" if unlogged else "LOGGED")
+                    )
+                )
+                logger.info(
+                    "Set %s to %s", tableName, "UNLOGGED" if unlogged else "LOGGED"
                 )
 
-            ormSession.execute(LiveDbRawValueQueue.__table__.insert(), inserts)
             ormSession.commit()
 
         finally:
             ormSession.close()
+
+    # ---------------
+    # Queue mode change methods
+
+    @deferToThreadWrapWithLogger(logger)
+    def moveRowsFromOtherQueue(self):
+        """Move Rows From Other Queue
+
+        Move any updates left in the queue table of the other queue mode into the
+        queue table of this controller, this is called before the controller is
+        started.
+
+        """
+        ormSession = self._dbSessionCreator()
+        try:
+            result = ormSession.execute(self._moveRowsFromOtherQueueSql())
+            ormSession.commit()
+
+            if result.rowcount:
+                logger.info(
+                    "Moved %s queued raw values from the other queue mode",
+                    result.rowcount,
+                )
+
+        finally:
+            ormSession.close()
+
+    def _moveRowsFromOtherQueueSql(self):
+        return text(
+            """
+                WITH moved AS (
+                    DELETE FROM pl_livedb."LiveDbRawValuePending"
+                    RETURNING "id", "modelSetId", "key", "rawValue", "ingressTimeMs"
+                )
+                INSERT INTO pl_livedb."LiveDbRawValueQueue"
+                    ("id", "modelSetId", "key", "rawValue", "ingressTimeMs")
+                SELECT "id", "modelSetId", "key", "rawValue", "ingressTimeMs"
+                FROM moved
+            """
+        )
+
+
+class LiveDbValuePendingQueueController(LiveDbValueUpdateQueueController):
+    """LiveDB Value Pending Queue Controller
+
+    This controller queues raw value updates in the LiveDbRawValuePending table,
+    which holds only the latest value for each key, so there is nothing to
+    deduplicate.
+
+    """
+
+    _QueueDeclarative: ACIProcessorQueueTupleABC = LiveDbRawValuePending
+    _VacuumDeclaratives = (LiveDbRawValuePending, LiveDbItem)
+
+    def _dedupeQueueSql(self, lastFetchedId: int, dedupeLimit: int):
+        # The upsert has already deduplicated the updates
+        return None
+
+    def _insertQueueRows(self, ormSession, rows: List[tuple]):
+        upsertRawValuePendingRows(ormSession, rows)
+
+    def _moveRowsFromOtherQueueSql(self):
+        return text(
+            """
+                WITH moved AS (
+                    DELETE FROM pl_livedb."LiveDbRawValueQueue"
+                    RETURNING "id", "modelSetId", "key", "rawValue", "ingressTimeMs"
+                )
+                INSERT INTO pl_livedb."LiveDbRawValuePending"
+                    ("id", "modelSetId", "key", "rawValue", "ingressTimeMs")
+                SELECT DISTINCT ON ("modelSetId", "key")
+                    "id", "modelSetId", "key", "rawValue", "ingressTimeMs"
+                FROM moved
+                ORDER BY "modelSetId", "key", "id" DESC
+                ON CONFLICT ("modelSetId", "key") DO UPDATE
+                SET "id" = EXCLUDED."id",
+                    "rawValue" = EXCLUDED."rawValue",
+                    "ingressTimeMs" = EXCLUDED."ingressTimeMs"
+                WHERE "LiveDbRawValuePending"."id" < EXCLUDED."id"
+            """
+        )
@@ -0,0 +1,126 @@
+from twisted.internet import defer, task
+from twisted.trial import unittest
+
+from peek_abstract_chunked_index.private.server.controller import (
+    ACIProcessorQueueControllerABC as aciQueueControllerModule,
+)
+from peek_abstract_chunked_index.private.server.controller.ACIProcessorQueueControllerABC import (
+    ACIProcessorQueueBlockItem,
+)
+from peek_plugin_livedb._private.server.controller.LiveDbValueUpdateQueueController import (
+    LiveDbValueUpdateQueueController,
+)
+
+
+class _StubStatus:
+    def __getattr__(self, name):
+        return 0
+
+
+class _StubAdminStatusController:
+    def __init__(self):
+        self.status = _StubStatus()
+
+    def notify(self):
+        pass
+
+
+def _makeBlock(queueId: int) -> ACIProcessorQueueBlockItem:
+    return ACIProcessorQueueBlockItem([queueId], b"", {"1:KEY%s" % queueId})
+
+
+class LiveDbValueUpdateQueueControllerShardTest(unittest.TestCase):
+    """Sharding Test
+
+    The fetch and the worker are stubbed, the base class runs as it is, with a
+    Clock for its reactor, so the retry of a failed block can be stepped.
+
+    """
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(aciQueueControllerModule, "reactor", self.clock)
+
+        self.controller = LiveDbValueUpdateQueueController(
+            None, _StubAdminStatusController(), None, shardCount=2
+        )
+
+        # The (shard, block) list the next fetch returns
+        self.fetched = []
+
+        # The deferreds the worker returns, in order
+        self.workerResults = []
+
+        self.patch(self.controller, "_fetchQueueBlocks", self._fetchQueueBlocks)
+        self.patch(self.controller, "_sendToWorker", self._sendToWorker)
+
+    def _fetchQueueBlocks(self, toGrab, shardRoom=None):
+        shardBlocks, self.fetched = self.fetched, []
+        for _, block in shardBlocks:
+            self.controller._queueIdsInBuffer.update(block.queueIds)
+        return defer.succeed(shardBlocks)
+
+    def _sendToWorker(self, block):
+        # A None result has nothing to process, see _processWorkerResults
+        return self.workerResults.pop(0)
+
+    @defer.inlineCallbacks
+    def _fetchAndDispatch(self):
+        # ACIProcessorQueueControllerABC._poll counts each block it dispatches
+        blocks = yield self.controller._fetchShardedBlocks()
+        self.controller._queueCount += len(blocks)
+        return blocks
+
+    @defer.inlineCallbacks
+    def test_oneBlockPerShardInQueueOrder(self):
+        block1, block2, block3 = _makeBlock(1), _makeBlock(2), _makeBlock(3)
+        self.fetched = [(0, block1), (0, block2), (1, block3)]
+
+        blocks = yield self._fetchAndDispatch()
+        self.assertEqual(blocks, [block1, block3])
+
+        # Both shards are in flight, block2 waits for block1
+        blocks = yield self._fetchAndDispatch()
+        self.assertEqual(blocks, [])
+
+    @defer.inlineCallbacks
+    def test_shardFreedAfterBlockSucceeds(self):
+        block1, block2 = _makeBlock(1), _makeBlock(2)
+        self.fetched = [(0, block1), (0, block2)]
+
+        blocks = yield self._fetchAndDispatch()
+        self.assertEqual(blocks, [block1])
+
+        self.workerResults = [defer.succeed(None)]
+        yield self.controller._runWorkerTask(block1)
+        self.assertNotIn(0, self.controller._shardsInFlight)
+
+        blocks = yield self._fetchAndDispatch()
+        self.assertEqual(blocks, [block2])
+
+    @defer.inlineCallbacks
+    def test_failedBlockKeepsItsShard(self):
+        block1, block2 = _makeBlock(1), _makeBlock(2)
+        self.fetched = [(0, block1), (0, block2)]
+
+        blocks = yield self._fetchAndDispatch()
+        self.assertEqual(blocks, [block1])
+
+        self.workerResults = [
+            defer.fail(Exception("The worker failed")),
+            defer.succeed(None),
+        ]
+        yield self.controller._runWorkerTask(block1)
+
+        # The base class retries block1 later, block2 must wait for it
+        self.assertIn(0, self.controller._shardsInFlight)
+        blocks = yield self._fetchAndDispatch()
+        self.assertEqual(blocks, [])
+
+        # The retry succeeds
+        self.clock.advance(2.0)
+        self.assertEqual(self.workerResults, [])
+        self.assertNotIn(0, self.controller._shardsInFlight)
+
+        blocks = yield self._fetchAndDispatch()
+        self.assertEqual(blocks, [block2])
@@ -0,0 +1,184 @@
+import logging
+import time
+from bisect import bisect_left
+from typing import Dict, List
+
+from peek_plugin_livedb._private.server.controller.AdminStatusController import (
+    AdminStatusController,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """Latency Histogram
+
+    Counts latencies into fixed buckets, in milliseconds. A percentile is the upper
+    bound of the bucket it falls in.
+
+    """
+
+    #: The upper bound of each bucket, the last bucket has no bound
+    BUCKET_BOUNDS_MS = (
+        1,
+        2,
+        5,
+        10,
+        20,
+        50,
+        100,
+        200,
+        500,
+        1000,
+        2000,
+        5000,
+        10000,
+        30000,
+        60000,
+        300000,
+    )
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.sumMs = 0
+
+    def add(self, latencyMs: int) -> None:
+        self.counts[bisect_left(self.BUCKET_BOUNDS_MS, latencyMs)] += 1
+        self.count += 1
+        self.sumMs += latencyMs
+
+    def percentile(self, percent: float) -> int:
+        """Percentile
+
+        :returns: The upper bound of the bucket, or the largest bound if the
+            percentile is in the last bucket, 0 if it's empty.
+
+        """
+        if not self.count:
+            return 0
+
+        rank = self.count * percent / 100.0
+        total = 0
+        for index, count in enumerate(self.counts):
+            total += count
+            if rank <= total:
+                break
+
+        return self.BUCKET_BOUNDS_MS[min(index, len(self.BUCKET_BOUNDS_MS) - 1)]
+
+    def toDict(self) -> Dict:
+        """To Dict
+
+        The buckets are cumulative, the same as a Prometheus histogram.
+
+        """
+        buckets = []
+        total = 0
+        for bound, count in zip(self.BUCKET_BOUNDS_MS + (None,), self.counts):
+            total += count
+            buckets.append([bound, total])
+
+        return dict(
+            count=self.count,
+            sumMs=self.sumMs,
+            p50Ms=self.percentile(50),
+            p99Ms=self.percentile(99),
+            buckets=buckets,
+        )
+
+
+class UpdateLatencyController:
+    """Update Latency Controller
+
+    Records how long raw value updates take to reach the diagram, from the time
+    updateRawValues received them:
+
+    * queueWait, until a worker started applying them.
+    * workerApply, how long the worker took, once per block.
+    * notify, until the display values were published to the observers, this is
+      end to end.
+
+    The worker and logic service clocks are assumed to be in sync.
+
+    The admin status shows the percentiles of the current window, which is reset
+    every WINDOW_SECONDS, metrics() returns the totals since the service started.
+
+    """
+
+    WINDOW_SECONDS = 60.0
+
+    NAMES = ("queueWait", "workerApply", "notify")
+
+    def __init__(self, adminStatusController: AdminStatusController):
+        self._adminStatusController = adminStatusController
+
+        self._totals = {name: LatencyHistogram() for name in self.NAMES}
+        self._windows = {name: LatencyHistogram() for name in self.NAMES}
+        self._windowStartTime = time.time()
+
+    def shutdown(self):
+        self._adminStatusController = None
+
+    def recordBlock(
+        self, ingressTimesMs: List[int], startTimeMs: int, commitTimeMs: int
+    ) -> None:
+        """Record Block
+
+        Record the latencies of one block of updates, call this when the display
+        values have been published.
+
+        :param ingressTimesMs: The ingress time of each update in the block
+        :param startTimeMs: When the worker started the block
+        :param commitTimeMs: When the worker committed the block
+
+        """
+        nowMs = int(time.time() * 1000)
+
+        if self.WINDOW_SECONDS < nowMs / 1000.0 - self._windowStartTime:
+            self._windows = {name: LatencyHistogram() for name in self.NAMES}
+            self._windowStartTime = nowMs / 1000.0
+
+        # Clock differences between hosts can make these slightly negative
+        latencies = dict(
+            queueWait=[max(startTimeMs - t, 0) for t in ingressTimesMs],
+            workerApply=[max(commitTimeMs - startTimeMs, 0)],
+            notify=[max(nowMs - t, 0) for t in ingressTimesMs],
+        )
+
+        for name, values in latencies.items():
+            total = self._totals[name]
+            window = self._windows[name]
+            for value in values:
+                total.add(value)
+                window.add(value)
+
+        self._notifyStatus()
+
+    def metrics(self) -> Dict[str, Dict]:
+        """Metrics
+
+        :returns: A dict of histogram name to LatencyHistogram.toDict(), plus the
+            window percentiles under "window".
+
+        """
+        metrics = {name: h.toDict() for name, h in self._totals.items()}
+        metrics["window"] = {
+            name: dict(p50Ms=h.percentile(50), p99Ms=h.percentile(99))
+            for name, h in self._windows.items()
+        }
+        return metrics
+
+    def _notifyStatus(self) -> None:
+        if not self._adminStatusController:
+            return
+
+        status = self._adminStatusController.status
+        windows = self._windows
+        status.rawValueQueueWaitP50Ms = windows["queueWait"].percentile(50)
+        status.rawValueQueueWaitP99Ms = windows["queueWait"].percentile(99)
+        status.rawValueWorkerApplyP50Ms = windows["workerApply"].percentile(50)
+        status.rawValueWorkerApplyP99Ms = windows["workerApply"].percentile(99)
+        status.rawValueNotifyP50Ms = windows["notify"].percentile(50)
+        status.rawValueNotifyP99Ms = windows["notify"].percentile(99)
+        self._adminStatusController.notify()
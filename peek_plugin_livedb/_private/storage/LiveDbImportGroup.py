@@ -0,0 +1,69 @@
+import logging
+from typing import Iterable, Optional
+
+from sqlalchemy import Column, ForeignKey, Index, and_
+from sqlalchemy import Integer, String
+from vortex.Tuple import Tuple, addTupleType
+
+from peek_plugin_livedb._private.PluginNames import livedbTuplePrefix
+from .DeclarativeBase import DeclarativeBase
+
+logger = logging.getLogger(__name__)
+
+
+@addTupleType
+class LiveDbImportGroup(DeclarativeBase, Tuple):
+    """LiveDB Import Group
+
+    This records the content hash of each group of items imported with
+    importLiveDbItemGroups, a group is the items with the same importHash.
+
+    A group that is imported again with the same content hash is skipped.
+
+    """
+
+    __tablename__ = "LiveDbImportGroup"
+    __tupleType__ = livedbTuplePrefix + __tablename__
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    modelSetId = Column(
+        Integer,
+        ForeignKey("LiveDbModelSet.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    importHash = Column(String, nullable=False)
+
+    # comment="The hash of the keys and dataTypes of the items in the group"
+    contentHash = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index(
+            "idx_LiveDbImportGroup_importHash", modelSetId, importHash, unique=True
+        ),
+    )
+
+
+def invalidateLiveDbImportGroups(
+    conn, modelSetId: int, importHashes: Iterable[Optional[str]]
+) -> None:
+    """Invalidate LiveDB Import Groups
+
+    Forget the content hashes of these groups, their items have been changed
+    outside of importLiveDbItemGroups, so the next group import must not skip them.
+
+    """
+    importHashes = [h for h in importHashes if h is not None]
+    if not importHashes:
+        return
+
+    table = LiveDbImportGroup.__table__
+    conn.execute(
+        table.delete().where(
+            and_(
+                table.c.modelSetId == modelSetId,
+                table.c.importHash.in_(importHashes),
+            )
+        )
+    )
@@ -1,9 +1,11 @@
 import logging
+from typing import List, Optional, Tuple as TupleT
 
-from sqlalchemy import Column, text
+from sqlalchemy import Column, column, text, values
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer, String
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql.expression import and_, bindparam
 from sqlalchemy.sql.schema import Index, Sequence
 
 from peek_plugin_livedb._private.PluginNames import livedbTuplePrefix
@@ -69,3 +71,97 @@ class LiveDbItem(DeclarativeBase, Tuple):
         Index("idx_LiveDbDKey_importHash", importHash, unique=False),
         Index("idx_LiveDbDKey_modelSet_key", modelSetId, key, unique=True),
     )
+
+
+# ---------------
+# Bulk value update methods
+#
+# A value row is (key, rawValue, displayValue)
+
+_ValueRowT = TupleT[str, Optional[str], Optional[str]]
+
+#: The number of rows per VALUES list in updateLiveDbItemValues
+UPDATE_VALUES_CHUNK_SIZE = 5000
+
+
+def updateLiveDbItemValues(
+    ormSession, modelSetId: int, rows: List[_ValueRowT]
+) -> List[str]:
+    """Update LiveDB Item Values
+
+    Update the raw and display values of the items with one
+    ``UPDATE ... FROM (VALUES ...)`` statement per chunk of rows.
+
+    If a key is in the rows more than once, the last row wins.
+
+    :returns: The keys of the items that were updated, keys that don't exist are
+        not returned.
+
+    """
+    # An UPDATE FROM can't update the same row twice
+    rows = list({r[0]: r for r in rows}.values())
+
+    table = LiveDbItem.__table__
+    updatedKeys = []
+
+    for start in range(0, len(rows), UPDATE_VALUES_CHUNK_SIZE):
+        newValues = values(
+            column("key", String),
+            column("rawValue", String),
+            column("displayValue", String),
+            name="newValues",
+        ).data(rows[start : start + UPDATE_VALUES_CHUNK_SIZE])
+
+        stmt = (
+            table.update()
+            .where(
+                and_(
+                    table.c.modelSetId == modelSetId,
+                    table.c.key == newValues.c.key,
+                )
+            )
+            .values(
+                rawValue=newValues.c.rawValue,
+                displayValue=newValues.c.displayValue,
+            )
+            .returning(table.c.key)
+        )
+
+        updatedKeys.extend([row[0] for row in ormSession.execute(stmt)])
+
+    return updatedKeys
+
+
+def updateLiveDbItemValuesExecuteMany(
+    ormSession, modelSetId: int, rows: List[_ValueRowT]
+) -> None:
+    """Update LiveDB Item Values Execute Many
+
+    Update the values with an executemany of single row updates.
+
+    This was the worker apply path before updateLiveDbItemValues, it's kept for
+    benchmarking.
+
+    """
+    table = LiveDbItem.__table__
+
+    sql = (
+        table.update()
+        .where(
+            and_(
+                table.c.key == bindparam("b_key"),
+                table.c.modelSetId == modelSetId,
+            )
+        )
+        .values(
+            {
+                "rawValue": bindparam("b_rawValue"),
+                "displayValue": bindparam("b_displayValue"),
+            }
+        )
+    )
+
+    ormSession.execute(
+        sql,
+        [dict(b_key=r[0], b_rawValue=r[1], b_displayValue=r[2]) for r in rows],
+    )
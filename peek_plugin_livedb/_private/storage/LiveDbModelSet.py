@@ -1,5 +1,9 @@
-from sqlalchemy import Column
+from threading import Lock
+from typing import Dict
+
+from sqlalchemy import Boolean, Column, false, select
 from sqlalchemy import Integer, String
+from sqlalchemy.dialects.postgresql import insert
 from vortex.Tuple import addTupleType, Tuple
 
 from peek_plugin_livedb._private.PluginNames import livedbTuplePrefix
@@ -18,11 +22,79 @@ class LiveDbModelSet(DeclarativeBase, Tuple):
 
     propsJson = Column(String)
 
+    # Drop raw value updates that don't change the stored raw value
+    suppressUnchangedRawValues = Column(
+        Boolean, nullable=False, server_default=false()
+    )
+
+
+# ---------------
+# Model Set Registry
+#
+# Model sets are created once and never change, so each process (logic and
+# workers) caches them after the first lookup. A lookup that misses reloads the
+# cache, which picks up model sets added by other processes.
+#
+# The cached objects are detached copies, don't add them to a session.
+#
+# suppressUnchangedRawValues can change, so it isn't cached, it's None in the cached
+# copies. Read it from the table, see LiveDbController.
+#
+# A new model set is created in its own transaction, so the transaction of the
+# caller's session isn't committed.
+
+_modelSetCacheLock = Lock()
+_modelSetByKey: Dict[str, LiveDbModelSet] = {}
+_modelSetById: Dict[int, LiveDbModelSet] = {}
+
 
 def getOrCreateLiveDbModelSet(session, modelSetKey: str) -> LiveDbModelSet:
-    qry = session.query(LiveDbModelSet).filter(LiveDbModelSet.key == modelSetKey)
-    if not qry.count():
-        session.add(LiveDbModelSet(key=modelSetKey, name=modelSetKey))
-        session.commit()
+    modelSet = _modelSetByKey.get(modelSetKey)
+    if modelSet:
+        return modelSet
+
+    with _modelSetCacheLock:
+        _loadLiveDbModelSets(session)
+        modelSet = _modelSetByKey.get(modelSetKey)
+        if modelSet:
+            return modelSet
+
+        # Another process may be creating the same model set, let the database
+        # decide who wins.
+        table = LiveDbModelSet.__table__
+        with session.get_bind().engine.begin() as conn:
+            conn.execute(
+                insert(table)
+                .values(key=modelSetKey, name=modelSetKey)
+                .on_conflict_do_nothing()
+            )
+
+        _loadLiveDbModelSets(session)
+        return _modelSetByKey[modelSetKey]
+
+
+def getLiveDbModelSetById(session, modelSetId: int) -> LiveDbModelSet:
+    modelSet = _modelSetById.get(modelSetId)
+    if modelSet:
+        return modelSet
+
+    # The model set must have been added by another process
+    with _modelSetCacheLock:
+        _loadLiveDbModelSets(session)
+        return _modelSetById[modelSetId]
+
+
+def _loadLiveDbModelSets(session) -> None:
+    table = LiveDbModelSet.__table__
+    rows = session.execute(select([table])).fetchall()
 
-    return qry.one()
+    for row in rows:
+        modelSet = LiveDbModelSet(
+            id=row.id,
+            key=row.key,
+            name=row.name,
+            comment=row.comment,
+            propsJson=row.propsJson,
+        )
+        _modelSetByKey[modelSet.key] = modelSet
+        _modelSetById[modelSet.id] = modelSet
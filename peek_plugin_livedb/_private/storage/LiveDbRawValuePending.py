@@ -0,0 +1,104 @@
+import logging
+from typing import List
+
+from sqlalchemy import Column, BigInteger, Index, text
+from sqlalchemy import Integer, String
+from sqlalchemy.dialects.postgresql import insert
+from vortex.Tuple import Tuple, addTupleType
+
+from peek_abstract_chunked_index.private.tuples.ACIProcessorQueueTupleABC import (
+    ACIProcessorQueueTupleABC,
+)
+from .DeclarativeBase import DeclarativeBase
+from .LiveDbRawValueQueue import NOW_EPOCH_MS
+from ..PluginNames import livedbTuplePrefix
+
+logger = logging.getLogger(__name__)
+
+# The pending table shares the id sequence of the raw value queue, so ids stay in
+# order when the queue mode is changed.
+_NEXT_QUEUE_ID = text("""nextval('pl_livedb."LiveDbRawValueQueue_id_seq"')""")
+
+
+@addTupleType
+class LiveDbRawValuePending(Tuple, DeclarativeBase, ACIProcessorQueueTupleABC):
+    """LiveDB Raw Value Pending
+
+    This is an alternative to the append only LiveDbRawValueQueue, it holds one
+    row per (modelSetId, key), the latest raw value that is yet to be applied.
+
+    Every upsert gives the row a new id, the worker deletes the rows by the ids it
+    was given, so a row that is updated while it's being processed remains in the
+    table, and will be processed again with the newer value.
+
+    """
+
+    __tablename__ = "LiveDbRawValuePending"
+    __tupleType__ = livedbTuplePrefix + __tablename__
+
+    id = Column(BigInteger, primary_key=True, server_default=_NEXT_QUEUE_ID)
+
+    modelSetId = Column(Integer, nullable=False)
+    key = Column(String, nullable=False)
+    rawValue = Column(String)
+
+    # See LiveDbRawValueQueue.ingressTimeMs, this is the time of the latest value
+    ingressTimeMs = Column(BigInteger, nullable=False, server_default=NOW_EPOCH_MS)
+
+    @classmethod
+    def sqlCoreLoad(cls, row):
+        return LiveDbRawValuePending(
+            id=row.id,
+            modelSetId=row.modelSetId,
+            key=row.key,
+            rawValue=row.rawValue,
+            ingressTimeMs=row.ingressTimeMs,
+        )
+
+    @property
+    def ckiUniqueKey(self):
+        """ See LiveDbRawValueQueueTuple.ckiUniqueKey """
+        return "%s:%s" % (self.modelSetId, self.key)
+
+    __table_args__ = (
+        Index("idx_LiveDbRawValuePending_key", modelSetId, key, unique=True),
+    )
+
+
+#: The number of rows per upsert statement
+UPSERT_CHUNK_SIZE = 5000
+
+
+def upsertRawValuePendingRows(ormSession, rows: List[tuple]) -> None:
+    """Upsert Raw Value Pending Rows
+
+    Write the latest raw values to the pending table, replacing any value that is
+    already pending for the key.
+
+    A row is (modelSetId, key, rawValue, ingressTimeMs)
+
+    """
+    # An upsert can't touch the same row twice, the last value wins
+    rowsByKey = {(r[0], r[1]): r for r in rows}
+
+    # Concurrent upserts lock the rows in the same order, so they can't deadlock
+    rows = [rowsByKey[k] for k in sorted(rowsByKey)]
+
+    table = LiveDbRawValuePending.__table__
+
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        stmt = insert(table).values(
+            [
+                dict(modelSetId=r[0], key=r[1], rawValue=r[2], ingressTimeMs=r[3])
+                for r in rows[start : start + UPSERT_CHUNK_SIZE]
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.modelSetId, table.c.key],
+            set_=dict(
+                rawValue=stmt.excluded.rawValue,
+                ingressTimeMs=stmt.excluded.ingressTimeMs,
+                id=_NEXT_QUEUE_ID,
+            ),
+        )
+        ormSession.execute(stmt)
@@ -1,7 +1,8 @@
 import logging
-from typing import Optional
+from io import StringIO
+from typing import List, Optional, Tuple as TupleT
 
-from sqlalchemy import Column, BigInteger, Index
+from sqlalchemy import Column, BigInteger, Index, text
 from sqlalchemy import Integer, String
 from vortex.Tuple import Tuple, addTupleType
 
@@ -13,6 +14,9 @@ from ..PluginNames import livedbTuplePrefix
 
 logger = logging.getLogger(__name__)
 
+#: The time now, in milliseconds since the epoch
+NOW_EPOCH_MS = text("(extract(epoch from now()) * 1000)::bigint")
+
 
 @addTupleType
 class LiveDbRawValueQueue(Tuple, DeclarativeBase, ACIProcessorQueueTupleABC):
@@ -25,10 +29,18 @@ class LiveDbRawValueQueue(Tuple, DeclarativeBase, ACIProcessorQueueTupleABC):
     key = Column(String, nullable=False)
     rawValue = Column(String)
 
+    # When the logic service received the update, in milliseconds since the epoch.
+    # This isn't a DateTime, so it loads as an int in PL/Python.
+    ingressTimeMs = Column(BigInteger, nullable=False, server_default=NOW_EPOCH_MS)
+
     @classmethod
     def sqlCoreLoad(cls, row):
         return LiveDbRawValueQueue(
-            id=row.id, modelSetId=row.modelSetId, key=row.key, rawValue=row.rawValue
+            id=row.id,
+            modelSetId=row.modelSetId,
+            key=row.key,
+            rawValue=row.rawValue,
+            ingressTimeMs=row.ingressTimeMs,
         )
 
     @property
@@ -40,4 +52,71 @@ class LiveDbRawValueQueue(Tuple, DeclarativeBase, ACIProcessorQueueTupleABC):
         Index(
             "idx_LiveDbRawValueQueue_all", id, modelSetId, key, rawValue, unique=False
         ),
+        # For deleting the queued values of deleted items
+        Index("idx_LiveDbRawValueQueue_key", modelSetId, key, unique=False),
+    )
+
+
+# ---------------
+# Bulk insert methods
+#
+# A queue row is (modelSetId, key, rawValue, ingressTimeMs)
+
+_QueueRowT = TupleT[int, str, Optional[str], int]
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def insertRawValueQueueRows(ormSession, rows: List[_QueueRowT]) -> None:
+    """Insert Raw Value Queue Rows
+
+    Insert the rows with an executemany of single row inserts.
+
+    """
+    ormSession.execute(
+        LiveDbRawValueQueue.__table__.insert(),
+        [
+            dict(modelSetId=r[0], key=r[1], rawValue=r[2], ingressTimeMs=r[3])
+            for r in rows
+        ],
     )
+
+
+def copyRawValueQueueRows(ormSession, rows: List[_QueueRowT]) -> None:
+    """Copy Raw Value Queue Rows
+
+    Stream the rows into the queue table with "COPY ... FROM STDIN" on the raw
+    psycopg2 connection of the session. This is many times faster than the
+    executemany for large batches.
+
+    The rows are inserted in the sessions transaction, the caller commits.
+
+    """
+
+    def esc(value) -> str:
+        if value is None:
+            return "\\N"
+        return str(value).translate(_COPY_ESCAPES)
+
+    buffer = StringIO()
+    for modelSetId, key, rawValue, ingressTimeMs in rows:
+        buffer.write(
+            "%s\t%s\t%s\t%s\n" % (modelSetId, esc(key), esc(rawValue), ingressTimeMs)
+        )
+    buffer.seek(0)
+
+    table = LiveDbRawValueQueue.__table__
+    sql = (
+        'COPY "%s"."%s" ("modelSetId", "key", "rawValue", "ingressTimeMs")'
+        " FROM STDIN"
+    ) % (
+        table.schema,
+        table.name,
+    )
+
+    cursor = ormSession.connection().connection.cursor()
+    try:
+        cursor.copy_expert(sql, buffer)
+
+    finally:
+        cursor.close()
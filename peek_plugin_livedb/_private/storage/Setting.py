@@ -258,3 +258,27 @@ def globalSetting(ormSession, key=None, value=None):
 VALUE_UPDATER_ENABLED = PropertyKey(
     "Value Updater Enabled", True, propertyDict=globalProperties
 )
+
+RAW_VALUE_BUFFER_ENABLED = PropertyKey(
+    "Raw Value Buffer Enabled", False, propertyDict=globalProperties
+)
+
+RAW_VALUE_PENDING_QUEUE_ENABLED = PropertyKey(
+    "Raw Value Latest Value Queue Enabled", False, propertyDict=globalProperties
+)
+
+RAW_VALUE_QUEUE_UNLOGGED = PropertyKey(
+    "Raw Value Queue Unlogged", False, propertyDict=globalProperties
+)
+
+VALUE_UPDATER_ADAPTIVE_SIZING = PropertyKey(
+    "Value Updater Adaptive Sizing", False, propertyDict=globalProperties
+)
+
+VALUE_UPDATER_SHARD_COUNT = PropertyKey(
+    "Value Updater Shard Count", 0, propertyDict=globalProperties
+)
+
+IMPORT_ADDITIONS_CHUNK_SIZE = PropertyKey(
+    "Import Additions Chunk Size", 2500, propertyDict=globalProperties
+)
@@ -11,3 +11,23 @@ class AdminStatusTuple(Tuple):
     rawValueQueueSize: int = TupleField(0)
     rawValueProcessedTotal: int = TupleField(0)
     rawValueLastError: str = TupleField()
+    rawValueSuppressedTotal: int = TupleField(0)
+
+    rawValueQueueItemsPerTask: int = TupleField(0)
+    rawValueQueueBlocksMax: int = TupleField(0)
+    rawValueQueuePollPeriodMs: int = TupleField(0)
+    rawValueWorkerTaskMs: int = TupleField(0)
+
+    rawValueBufferFlushLatencyMs: int = TupleField(0)
+    rawValueBufferCoalescingRatio: float = TupleField(0.0)
+
+    rawValueQueueWaitP50Ms: int = TupleField(0)
+    rawValueQueueWaitP99Ms: int = TupleField(0)
+    rawValueWorkerApplyP50Ms: int = TupleField(0)
+    rawValueWorkerApplyP99Ms: int = TupleField(0)
+    rawValueNotifyP50Ms: int = TupleField(0)
+    rawValueNotifyP99Ms: int = TupleField(0)
+
+    importItemsInProgress: int = TupleField(0)
+    importItemsProcessedTotal: int = TupleField(0)
+    importLastError: str = TupleField()
@@ -4,6 +4,7 @@ from peek_plugin_base.worker.PluginWorkerEntryHookABC import PluginWorkerEntryHo
 from peek_plugin_livedb._private.storage.DeclarativeBase import loadStorageTuples
 from peek_plugin_livedb._private.tuples import loadPrivateTuples
 from peek_plugin_livedb._private.worker.tasks import (
+    LiveDbItemDeleteTask,
     LiveDbItemImportTask,
     LiveDbItemUpdateTask,
     BulkLoadChunkTask,
@@ -33,6 +34,7 @@ class WorkerEntryHook(PluginWorkerEntryHookABC):
     @property
     def celeryAppIncludes(self):
         return [
+            LiveDbItemDeleteTask.__name__,
             LiveDbItemImportTask.__name__,
             LiveDbItemUpdateTask.__name__,
             BulkLoadChunkTask.__name__,
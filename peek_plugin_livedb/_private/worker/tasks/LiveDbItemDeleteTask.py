@@ -0,0 +1,148 @@
+import logging
+from datetime import datetime
+from typing import List
+
+import pytz
+from sqlalchemy.sql.expression import and_, select
+from txcelery.defer import DeferrableTask
+
+from peek_plugin_base.storage.StorageUtil import makeCoreValuesSubqueryCondition
+from peek_plugin_base.worker import CeleryDbConn
+from peek_plugin_base.worker.CeleryApp import celeryApp
+from peek_plugin_livedb._private.storage.LiveDbImportGroup import (
+    invalidateLiveDbImportGroups,
+)
+from peek_plugin_livedb._private.storage.LiveDbItem import LiveDbItem
+from peek_plugin_livedb._private.storage.LiveDbModelSet import getOrCreateLiveDbModelSet
+from peek_plugin_livedb._private.storage.LiveDbRawValuePending import (
+    LiveDbRawValuePending,
+)
+from peek_plugin_livedb._private.storage.LiveDbRawValueQueue import LiveDbRawValueQueue
+
+logger = logging.getLogger(__name__)
+
+
+@DeferrableTask
+@celeryApp.task(bind=True)
+def deleteLiveDbItems(self, modelSetKey: str, keys: List[str]) -> List[str]:
+    """Delete LiveDB Items Task
+
+    Delete one chunk of items, the logic service splits the keys into chunks.
+
+    :param self: A celery reference to this task
+    :param modelSetKey: The model set name
+    :param keys: The keys of the items to delete
+    :returns: The keys of the items that were deleted.
+    """
+    liveDbTable = LiveDbItem.__table__
+
+    def makeCondition(engine, modelSetId):
+        return and_(
+            liveDbTable.c.modelSetId == modelSetId,
+            makeCoreValuesSubqueryCondition(engine, liveDbTable.c.key, keys),
+        )
+
+    return _deleteChunk(self, modelSetKey, makeCondition)
+
+
+@DeferrableTask
+@celeryApp.task(bind=True)
+def deleteLiveDbItemsByImportHash(
+    self, modelSetKey: str, importHash: str, chunkSize: int
+) -> List[str]:
+    """Delete LiveDB Items By Import Hash Task
+
+    Delete up to chunkSize items with the importHash, the logic service calls this
+    until no keys are returned.
+
+    :param self: A celery reference to this task
+    :param modelSetKey: The model set name
+    :param importHash: The import hash of the items to delete
+    :param chunkSize: The maximum number of items to delete
+    :returns: The keys of the items that were deleted.
+    """
+    liveDbTable = LiveDbItem.__table__
+
+    def makeCondition(engine, modelSetId):
+        chunkIds = (
+            select([liveDbTable.c.id])
+            .where(liveDbTable.c.modelSetId == modelSetId)
+            .where(liveDbTable.c.importHash == importHash)
+            .limit(chunkSize)
+        )
+        return liveDbTable.c.id.in_(chunkIds)
+
+    return _deleteChunk(self, modelSetKey, makeCondition)
+
+
+def _deleteChunk(task, modelSetKey: str, makeCondition) -> List[str]:
+    startTime = datetime.now(pytz.utc)
+
+    session = CeleryDbConn.getDbSession()
+    engine = CeleryDbConn.getDbEngine()
+    conn = engine.connect()
+    transaction = conn.begin()
+
+    liveDbTable = LiveDbItem.__table__
+    try:
+        liveDbModelSet = getOrCreateLiveDbModelSet(session, modelSetKey)
+
+        result = conn.execute(
+            liveDbTable.delete()
+            .where(makeCondition(engine, liveDbModelSet.id))
+            .returning(liveDbTable.c.key, liveDbTable.c.importHash)
+        )
+        deletedRows = result.fetchall()
+        deletedKeys = [o[0] for o in deletedRows]
+
+        if not deletedKeys:
+            transaction.commit()
+            return []
+
+        deleteQueuedRawValues(conn, engine, liveDbModelSet.id, deletedKeys)
+
+        # The groups of the deleted items must be imported again in full
+        invalidateLiveDbImportGroups(
+            conn, liveDbModelSet.id, set([o[1] for o in deletedRows])
+        )
+
+        transaction.commit()
+        logger.info(
+            "Deleted %s LiveDbItems in %s",
+            len(deletedKeys),
+            (datetime.now(pytz.utc) - startTime),
+        )
+
+        return deletedKeys
+
+    except Exception as e:
+        transaction.rollback()
+        logger.debug("Task failed, but it will retry. %s", e)
+        raise task.retry(exc=e, countdown=10)
+
+    finally:
+        conn.close()
+        session.close()
+
+
+def deleteQueuedRawValues(conn, engine, modelSetId: int, keys: List[str]) -> None:
+    """Delete Queued Raw Values
+
+    Delete the raw values still queued for deleted items, from both queue tables.
+
+    """
+    if not keys:
+        return
+
+    for queueTable in (
+        LiveDbRawValueQueue.__table__,
+        LiveDbRawValuePending.__table__,
+    ):
+        conn.execute(
+            queueTable.delete().where(
+                and_(
+                    queueTable.c.modelSetId == modelSetId,
+                    makeCoreValuesSubqueryCondition(engine, queueTable.c.key, keys),
+                )
+            )
+        )
@@ -3,30 +3,56 @@ from datetime import datetime
 from typing import List
 
 import pytz
-from sqlalchemy.sql.expression import select
+from sqlalchemy import String, column, exists, select, table, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql.expression import and_, or_
 from txcelery.defer import DeferrableTask
 
 from peek_plugin_base.storage.StorageUtil import makeCoreValuesSubqueryCondition
 from peek_plugin_base.worker import CeleryDbConn
+from peek_plugin_livedb._private.storage.LiveDbImportGroup import (
+    LiveDbImportGroup,
+    invalidateLiveDbImportGroups,
+)
 from peek_plugin_livedb._private.storage.LiveDbItem import LiveDbItem
 from peek_plugin_livedb._private.storage.LiveDbModelSet import getOrCreateLiveDbModelSet
 from peek_plugin_base.worker.CeleryApp import celeryApp
+from peek_plugin_livedb._private.worker.tasks.LiveDbItemDeleteTask import (
+    deleteQueuedRawValues,
+)
 from peek_plugin_livedb.tuples.ImportLiveDbItemTuple import ImportLiveDbItemTuple
+from peek_plugin_livedb.tuples.LiveDbDisplayValueCodec import encodeDisplayValueRows
 
 logger = logging.getLogger(__name__)
 
 
+#: The number of rows per upsert statement
+UPSERT_CHUNK_SIZE = 5000
+
+# The keys of the group being imported, it's dropped when the transaction ends
+_groupKeysTable = table("tmpLiveDbImportGroupKeys", column("key", String))
+
+
 @DeferrableTask
 @celeryApp.task(bind=True)
 def importLiveDbItems(
-    self, modelSetKey: str, newItems: List[ImportLiveDbItemTuple]
-) -> List[str]:
+    self,
+    modelSetKey: str,
+    newItems: List[ImportLiveDbItemTuple],
+    encodeRows: bool = False,
+) -> list:
     """Compile Grids Task
 
+    Items that don't exist are inserted. Items that exist have their dataType and
+    importHash updated, their values are left as they are.
+
     :param self: A celery reference to this task
     :param modelSetKey: The model set name
     :param newItems: The list of new items
-    :returns: A list of grid keys that have been updated.
+    :param encodeRows: Encode the returned rows with encodeDisplayValueRows
+    :returns: [insertedRows, updatedRows], items that exist and are unchanged are in
+        neither. The rows are [key, dataType, rawValue, displayValue] lists, as they
+        are stored after the import.
     """
 
     startTime = datetime.now(pytz.utc)
@@ -36,71 +62,183 @@ def importLiveDbItems(
     conn = engine.connect()
     transaction = conn.begin()
 
-    liveDbTable = LiveDbItem.__table__
     try:
 
         liveDbModelSet = getOrCreateLiveDbModelSet(session, modelSetKey)
 
-        # This will remove duplicates
+        # This will remove duplicates, an upsert can't touch the same row twice
         itemsByKey = {i.key: i for i in newItems}
+        items = list(itemsByKey.values())
 
-        allKeys = list(itemsByKey)
-        existingKeys = set()
-
-        # Query for existing keys, in 1000 chinks
-        chunkSize = 1000
-        offset = 0
-        while True:
-            chunk = allKeys[offset : offset + chunkSize]
-            if not chunk:
-                break
-            offset += chunkSize
-            stmt = (
-                select(liveDbTable.c.key)
-                .where(liveDbTable.c.modelSetId == liveDbModelSet.id)
-                .where(
-                    makeCoreValuesSubqueryCondition(engine, liveDbTable.c.key, chunk)
-                )
-            )
+        insertedRows, updatedRows, oldImportHashes = _upsertItems(
+            conn, liveDbModelSet.id, items
+        )
 
-            result = conn.execute(stmt)
+        # These items may have changed the content of import groups, the groups
+        # they are in now, and the groups they have moved from
+        invalidateLiveDbImportGroups(
+            conn,
+            liveDbModelSet.id,
+            set([i.importHash for i in items]) | oldImportHashes,
+        )
 
-            existingKeys.update([o[0] for o in result.fetchall()])
+        transaction.commit()
+        logger.info(
+            "Inserted %s LiveDbItems, updated %s, %s were unchanged, in %s",
+            len(insertedRows),
+            len(updatedRows),
+            len(items) - len(insertedRows) - len(updatedRows),
+            (datetime.now(pytz.utc) - startTime),
+        )
 
-        inserts = []
-        newKeys = []
+        if encodeRows:
+            insertedRows = encodeDisplayValueRows(insertedRows)
+            updatedRows = encodeDisplayValueRows(updatedRows)
 
-        for newItem in itemsByKey.values():
-            if newItem.key in existingKeys:
-                continue
+        return [insertedRows, updatedRows]
 
-            inserts.append(
-                dict(
-                    modelSetId=liveDbModelSet.id,
-                    key=newItem.key,
-                    dataType=newItem.dataType,
-                    rawValue=newItem.rawValue,
-                    displayValue=newItem.displayValue,
-                    importHash=newItem.importHash,
-                )
-            )
+    except Exception as e:
+        transaction.rollback()
+        logger.debug("Task failed, but it will retry. %s", e)
+        raise self.retry(exc=e, countdown=10)
+
+    finally:
+        conn.close()
+        session.close()
+
+
+@DeferrableTask
+@celeryApp.task(bind=True)
+def importLiveDbItemGroup(
+    self,
+    modelSetKey: str,
+    importHash: str,
+    contentHash: str,
+    newItems: List[ImportLiveDbItemTuple],
+    encodeRows: bool = False,
+) -> list:
+    """Import LiveDB Item Group Task
+
+    Import the items of one import group, in one transaction.
+
+    The items are upserted the same as importLiveDbItems, then the items that still
+    have the importHash but are no longer in the group are deleted, then the
+    contentHash of the group is stored.
+
+    :param self: A celery reference to this task
+    :param modelSetKey: The model set name
+    :param importHash: The importHash of the group, all the items must have it
+    :param contentHash: The hash of the group content, see LiveDbImportGroup
+    :param newItems: All the items in the group
+    :param encodeRows: See importLiveDbItems
+    :returns: [insertedRows, updatedRows, deletedKeys], see importLiveDbItems.
+    """
+
+    startTime = datetime.now(pytz.utc)
+
+    session = CeleryDbConn.getDbSession()
+    engine = CeleryDbConn.getDbEngine()
+    conn = engine.connect()
+    transaction = conn.begin()
+
+    try:
+
+        liveDbModelSet = getOrCreateLiveDbModelSet(session, modelSetKey)
+
+        # This will remove duplicates, an upsert can't touch the same row twice
+        itemsByKey = {i.key: i for i in newItems}
+        items = list(itemsByKey.values())
+
+        insertedRows, updatedRows, oldImportHashes = _upsertItems(
+            conn, liveDbModelSet.id, items
+        )
+
+        # Items that have moved into this group have changed their old groups
+        invalidateLiveDbImportGroups(
+            conn, liveDbModelSet.id, oldImportHashes - {importHash}
+        )
+
+        deletedKeys = _deleteVanishedGroupItems(
+            conn, engine, liveDbModelSet.id, importHash, list(itemsByKey)
+        )
+
+        _storeGroupContentHash(conn, liveDbModelSet.id, importHash, contentHash)
+
+        transaction.commit()
+        logger.info(
+            "Imported group %s, inserted %s LiveDbItems, updated %s, deleted %s, in %s",
+            importHash,
+            len(insertedRows),
+            len(updatedRows),
+            len(deletedKeys),
+            (datetime.now(pytz.utc) - startTime),
+        )
+
+        if encodeRows:
+            insertedRows = encodeDisplayValueRows(insertedRows)
+            updatedRows = encodeDisplayValueRows(updatedRows)
+
+        return [insertedRows, updatedRows, deletedKeys]
+
+    except Exception as e:
+        transaction.rollback()
+        logger.debug("Task failed, but it will retry. %s", e)
+        raise self.retry(exc=e, countdown=10)
 
-            newKeys.append(newItem.key)
+    finally:
+        conn.close()
+        session.close()
 
-        if not inserts:
-            return []
 
-        conn.execute(LiveDbItem.__table__.insert(), inserts)
+@DeferrableTask
+@celeryApp.task(bind=True)
+def finishLiveDbItemGroupImport(
+    self,
+    modelSetKey: str,
+    importHash: str,
+    contentHash: str,
+    keys: List[str],
+) -> List[str]:
+    """Finish LiveDB Item Group Import Task
+
+    Large groups are upserted in chunks with importLiveDbItems, this then deletes
+    the items that still have the importHash but are no longer in the group, and
+    stores the contentHash of the group, in one transaction.
+
+    :param self: A celery reference to this task
+    :param modelSetKey: The model set name
+    :param importHash: The importHash of the group
+    :param contentHash: The hash of the group content, see LiveDbImportGroup
+    :param keys: The keys of all the items in the group
+    :returns: The deleted keys
+    """
+
+    startTime = datetime.now(pytz.utc)
+
+    session = CeleryDbConn.getDbSession()
+    engine = CeleryDbConn.getDbEngine()
+    conn = engine.connect()
+    transaction = conn.begin()
+
+    try:
+
+        liveDbModelSet = getOrCreateLiveDbModelSet(session, modelSetKey)
+
+        deletedKeys = _deleteVanishedGroupItems(
+            conn, engine, liveDbModelSet.id, importHash, list(set(keys))
+        )
+
+        _storeGroupContentHash(conn, liveDbModelSet.id, importHash, contentHash)
 
         transaction.commit()
         logger.info(
-            "Inserted %s LiveDbItems, %s already existed, in %s",
-            len(inserts),
-            len(existingKeys),
+            "Finished importing group %s, deleted %s LiveDbItems, in %s",
+            importHash,
+            len(deletedKeys),
             (datetime.now(pytz.utc) - startTime),
         )
 
-        return newKeys
+        return deletedKeys
 
     except Exception as e:
         transaction.rollback()
@@ -110,3 +248,146 @@ def importLiveDbItems(
     finally:
         conn.close()
         session.close()
+
+
+def _deleteVanishedGroupItems(
+    conn, engine, modelSetId: int, importHash: str, keys: List[str]
+) -> List[str]:
+    """Delete Vanished Group Items
+
+    Delete the items that have the importHash, but are not in keys. The keys are
+    loaded into a temporary table, so the delete is a join, not a NOT IN list.
+
+    :returns: The deleted keys
+    """
+    liveDbTable = LiveDbItem.__table__
+
+    conn.execute(
+        text(
+            'CREATE TEMPORARY TABLE "%s" ("key" VARCHAR PRIMARY KEY) ON COMMIT DROP'
+            % _groupKeysTable.name
+        )
+    )
+
+    for start in range(0, len(keys), UPSERT_CHUNK_SIZE):
+        conn.execute(
+            _groupKeysTable.insert(),
+            [dict(key=key) for key in keys[start : start + UPSERT_CHUNK_SIZE]],
+        )
+
+    # Give the planner the size of the table
+    conn.execute(text('ANALYZE "%s"' % _groupKeysTable.name))
+
+    result = conn.execute(
+        liveDbTable.delete()
+        .where(
+            and_(
+                liveDbTable.c.modelSetId == modelSetId,
+                liveDbTable.c.importHash == importHash,
+                ~exists().where(_groupKeysTable.c.key == liveDbTable.c.key),
+            )
+        )
+        .returning(liveDbTable.c.key)
+    )
+    deletedKeys = [o[0] for o in result.fetchall()]
+
+    deleteQueuedRawValues(conn, engine, modelSetId, deletedKeys)
+
+    return deletedKeys
+
+
+def _storeGroupContentHash(
+    conn, modelSetId: int, importHash: str, contentHash: str
+) -> None:
+    groupTable = LiveDbImportGroup.__table__
+
+    stmt = insert(groupTable).values(
+        modelSetId=modelSetId,
+        importHash=importHash,
+        contentHash=contentHash,
+    )
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[groupTable.c.modelSetId, groupTable.c.importHash],
+            set_=dict(contentHash=stmt.excluded.contentHash),
+        )
+    )
+
+
+def _upsertItems(conn, modelSetId: int, items: List[ImportLiveDbItemTuple]):
+    """Upsert Items
+
+    :returns: (insertedRows, updatedRows, oldImportHashes), oldImportHashes are the
+        importHashes the updated items had before the upsert.
+    """
+    liveDbTable = LiveDbItem.__table__
+
+    insertedRows = []
+    updatedRows = []
+    oldImportHashes = set()
+
+    # Concurrent imports lock the rows in the same order, so they can't deadlock
+    items = sorted(items, key=lambda i: i.key)
+
+    for start in range(0, len(items), UPSERT_CHUNK_SIZE):
+        chunkItems = items[start : start + UPSERT_CHUNK_SIZE]
+
+        # Lock the items that exist and read their importHashes, before the upsert
+        # changes them
+        oldImportHashByKey = dict(
+            conn.execute(
+                select([liveDbTable.c.key, liveDbTable.c.importHash])
+                .where(liveDbTable.c.modelSetId == modelSetId)
+                .where(
+                    makeCoreValuesSubqueryCondition(
+                        conn.engine, liveDbTable.c.key, [i.key for i in chunkItems]
+                    )
+                )
+                .order_by(liveDbTable.c.key)
+                .with_for_update()
+            ).fetchall()
+        )
+
+        stmt = insert(liveDbTable).values(
+            [
+                dict(
+                    modelSetId=modelSetId,
+                    key=newItem.key,
+                    dataType=newItem.dataType,
+                    rawValue=newItem.rawValue,
+                    displayValue=newItem.displayValue,
+                    importHash=newItem.importHash,
+                )
+                for newItem in chunkItems
+            ]
+        )
+
+        # Only rewrite the rows that have changed, unchanged rows aren't returned
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[liveDbTable.c.modelSetId, liveDbTable.c.key],
+            set_=dict(
+                dataType=stmt.excluded.dataType,
+                importHash=stmt.excluded.importHash,
+            ),
+            where=or_(
+                liveDbTable.c.dataType.is_distinct_from(stmt.excluded.dataType),
+                liveDbTable.c.importHash.is_distinct_from(stmt.excluded.importHash),
+            ),
+        )
+
+        stmt = stmt.returning(
+            liveDbTable.c.key,
+            liveDbTable.c.dataType,
+            liveDbTable.c.rawValue,
+            liveDbTable.c.displayValue,
+        )
+
+        for row in conn.execute(stmt).fetchall():
+            if row[0] in oldImportHashByKey:
+                updatedRows.append(list(row))
+                oldImportHashes.add(oldImportHashByKey[row[0]])
+            else:
+                insertedRows.append(list(row))
+
+    oldImportHashes.discard(None)
+    return insertedRows, updatedRows, oldImportHashes
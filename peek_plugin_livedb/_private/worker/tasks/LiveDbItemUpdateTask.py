@@ -1,33 +1,66 @@
 import logging
-from collections import defaultdict
+import time
+from collections import OrderedDict, defaultdict
 from datetime import datetime
-from typing import List, Dict
+from threading import Lock
+from typing import List, Dict, Optional, Tuple
 
 import pytz
-from sqlalchemy.sql.expression import bindparam, and_, select
+from sqlalchemy.sql.expression import select
 from txcelery.defer import DeferrableTask
 from vortex.Payload import Payload
 
 from peek_plugin_base.worker import CeleryDbConn
 from peek_plugin_base.worker.CeleryApp import celeryApp
-from peek_plugin_livedb._private.storage.LiveDbItem import LiveDbItem
-from peek_plugin_livedb._private.storage.LiveDbModelSet import LiveDbModelSet
+from peek_plugin_livedb._private.storage.LiveDbItem import (
+    LiveDbItem,
+    updateLiveDbItemValues,
+)
+from peek_plugin_livedb._private.storage.LiveDbModelSet import (
+    LiveDbModelSet,
+    getLiveDbModelSetById,
+)
 from peek_plugin_livedb._private.storage.LiveDbRawValueQueue import LiveDbRawValueQueue
 from peek_plugin_livedb.tuples.LiveDbDisplayValueTuple import LiveDbDisplayValueTuple
 
 logger = logging.getLogger(__name__)
 
+# ---------------
+# DataType Cache
+#
+# The dataType of an item rarely changes after it's imported, so each worker
+# process keeps an LRU of (modelSetId, key) -> dataType.
+#
+# The logic service sends a generation with each block, it changes when items are
+# imported or deleted, and the cache is cleared when it does.
+
+#: The maximum number of dataTypes cached per worker process. An entry is about
+#: 250 bytes with 30 character keys, so this is about 25MB per worker process.
+DATA_TYPE_CACHE_MAX_SIZE = 100000
+
+_dataTypeCacheLock = Lock()
+_dataTypeCache: Dict[Tuple[int, str], int] = OrderedDict()
+_dataTypeCacheGeneration: Optional[int] = None
+
 
 @DeferrableTask
 @celeryApp.task(bind=True)
-def updateValues(self, payloadEncodedArgs: bytes) -> None:
+def updateValues(
+    self, payloadEncodedArgs: bytes, dataTypeGeneration: Optional[int] = None
+) -> list:
     """Compile Grids Task
 
     :param self: A celery reference to this task
     :param payloadEncodedArgs: The updates from the queue controller
-    :returns: None
+    :param dataTypeGeneration: The generation of the item dataTypes, None disables
+        the dataType cache.
+    :returns: [displayValuesByModelSetKey, ingressTimesMs, startTimeMs,
+        commitTimeMs]. The display values of the updated items are grouped by model
+        set key, as [key, dataType, rawValue, displayValue] lists. The times are in
+        milliseconds since the epoch, and are used to record the update latency.
     """
     startTime = datetime.now(pytz.utc)
+    startTimeMs = int(time.time() * 1000)
 
     argData = Payload().fromEncodedPayload(payloadEncodedArgs).tuples
     allModelUpdates: List[LiveDbRawValueQueue] = argData[0]
@@ -38,18 +71,29 @@ def updateValues(self, payloadEncodedArgs: bytes) -> None:
     for update in allModelUpdates:
         updatesByModelSetId[update.modelSetId].append(update)
 
+    displayValuesByModelSetKey = {}
+
     ormSession = CeleryDbConn.getDbSession()
     try:
 
         for modelSetId, modelUpdates in updatesByModelSetId.items():
-            _updateValuesForModelSet(modelSetId, modelUpdates, ormSession)
+            modelSetKey, displayValues = _updateValuesForModelSet(
+                modelSetId, modelUpdates, ormSession, dataTypeGeneration
+            )
+            if displayValues:
+                displayValuesByModelSetKey[modelSetKey] = displayValues
 
         # ---------------
-        # delete the queue items
-        dispQueueTable = LiveDbRawValueQueue.__table__
+        # delete the queue items, from which ever queue table the items came from
+        dispQueueTable = (
+            allModelUpdates[0].__table__
+            if allModelUpdates
+            else LiveDbRawValueQueue.__table__
+        )
         ormSession.execute(dispQueueTable.delete(dispQueueTable.c.id.in_(queueItemIds)))
 
         ormSession.commit()
+        commitTimeMs = int(time.time() * 1000)
 
         # ---------------
         # Finally, tell log some statistics
@@ -59,6 +103,13 @@ def updateValues(self, payloadEncodedArgs: bytes) -> None:
             (datetime.now(pytz.utc) - startTime),
         )
 
+        return [
+            displayValuesByModelSetKey,
+            [u.ingressTimeMs for u in allModelUpdates],
+            startTimeMs,
+            commitTimeMs,
+        ]
+
     except Exception as e:
         logger.exception(e)
         raise self.retry(exc=e, countdown=2)
@@ -67,7 +118,9 @@ def updateValues(self, payloadEncodedArgs: bytes) -> None:
         ormSession.close()
 
 
-def _updateValuesForModelSet(modelSetId, modelUpdates, ormSession):
+def _updateValuesForModelSet(
+    modelSetId, modelUpdates, ormSession, dataTypeGeneration: Optional[int]
+) -> Tuple[str, List[list]]:
     # Try to load the Diagram plugins API
     try:
         from peek_plugin_diagram.worker.WorkerApi import WorkerApi as DiagramWorkerApi
@@ -75,12 +128,8 @@ def _updateValuesForModelSet(modelSetId, modelUpdates, ormSession):
         logger.warning("Failed to load the diagram WorkerAPI")
         DiagramWorkerApi = None
 
-    table = LiveDbItem.__table__
-
     # Load the Model Set
-    liveDbModelSet = (
-        ormSession.query(LiveDbModelSet).filter(LiveDbModelSet.id == modelSetId).one()
-    )
+    liveDbModelSet = getLiveDbModelSetById(ormSession, modelSetId)
 
     # Create a list of keys
     updatedKeys = [i.key for i in modelUpdates]
@@ -88,7 +137,7 @@ def _updateValuesForModelSet(modelSetId, modelUpdates, ormSession):
     # ---------------
     # Make a list of display items from the provided data
     displayItems = _makeDisplayValueTuples(
-        liveDbModelSet, modelUpdates, ormSession, updatedKeys
+        liveDbModelSet, modelUpdates, ormSession, updatedKeys, dataTypeGeneration
     )
 
     # ---------------
@@ -99,43 +148,37 @@ def _updateValuesForModelSet(modelSetId, modelUpdates, ormSession):
         )
 
     # ---------------
-    # Update the the values in the tables
-    sql = (
-        table.update()
-        .where(
-            and_(
-                table.c.key == bindparam("b_key"),
-                table.c.modelSetId == liveDbModelSet.id,
-            )
-        )
-        .values(
-            {
-                "rawValue": bindparam("b_rawValue"),
-                "displayValue": bindparam("b_displayValue"),
-            }
-        )
-    )
-
-    ormSession.execute(
-        sql,
-        [
-            dict(b_key=o.key, b_rawValue=o.rawValue, b_displayValue=o.displayValue)
-            for o in displayItems
-        ],
+    # Update the the values in the tables, in one set based statement
+    updatedKeys = updateLiveDbItemValues(
+        ormSession,
+        liveDbModelSet.id,
+        [(o.key, o.rawValue, o.displayValue) for o in displayItems],
     )
 
     # ---------------
     # Tell the diagram plugin that livedb values have been updated
-    if DiagramWorkerApi:
+    if DiagramWorkerApi and updatedKeys:
         DiagramWorkerApi.liveDbDisplayValueUpdateNotify(
             ormSession, modelSetKey=liveDbModelSet.key, updatedKeys=updatedKeys
         )
 
+    # ---------------
+    # Return the display values of the updated items, the last value wins
+    updatedKeys = set(updatedKeys)
+    displayItemsByKey = {o.key: o for o in displayItems if o.key in updatedKeys}
 
-def _makeDisplayValueTuples(liveDbModelSet, modelUpdates, ormSession, updatedKeys):
+    return liveDbModelSet.key, [
+        [o.key, o.dataType, o.rawValue, o.displayValue]
+        for o in displayItemsByKey.values()
+    ]
+
+
+def _makeDisplayValueTuples(
+    liveDbModelSet, modelUpdates, ormSession, updatedKeys, dataTypeGeneration
+):
     # Load the key typ lookups
-    dataTypeLookup = _getLiveDbKeyDatatypeDict(
-        ormSession, liveDbModelSet, liveDbKeys=updatedKeys
+    dataTypeLookup = _getCachedLiveDbKeyDatatypeDict(
+        ormSession, liveDbModelSet, updatedKeys, dataTypeGeneration
     )
 
     displayItems = []
@@ -151,6 +194,53 @@ def _makeDisplayValueTuples(liveDbModelSet, modelUpdates, ormSession, updatedKey
     return displayItems
 
 
+def _getCachedLiveDbKeyDatatypeDict(
+    ormSession,
+    liveDbModelSet: LiveDbModelSet,
+    liveDbKeys: List[str],
+    dataTypeGeneration: Optional[int],
+) -> Dict[str, int]:
+    global _dataTypeCacheGeneration
+
+    if dataTypeGeneration is None:
+        return _getLiveDbKeyDatatypeDict(ormSession, liveDbModelSet, liveDbKeys)
+
+    modelSetId = liveDbModelSet.id
+    dataTypeLookup = {}
+    missingKeys = []
+
+    with _dataTypeCacheLock:
+        if _dataTypeCacheGeneration != dataTypeGeneration:
+            _dataTypeCache.clear()
+            _dataTypeCacheGeneration = dataTypeGeneration
+
+        for key in set(liveDbKeys):
+            dataType = _dataTypeCache.get((modelSetId, key))
+            if dataType is None:
+                missingKeys.append(key)
+            else:
+                _dataTypeCache.move_to_end((modelSetId, key))
+                dataTypeLookup[key] = dataType
+
+    if not missingKeys:
+        return dataTypeLookup
+
+    # Keys that don't exist are not cached, an import will change the generation
+    loaded = _getLiveDbKeyDatatypeDict(ormSession, liveDbModelSet, missingKeys)
+    dataTypeLookup.update(loaded)
+
+    with _dataTypeCacheLock:
+        # Don't cache values loaded for an older generation
+        if _dataTypeCacheGeneration == dataTypeGeneration:
+            for key, dataType in loaded.items():
+                _dataTypeCache[(modelSetId, key)] = dataType
+
+            while len(_dataTypeCache) > DATA_TYPE_CACHE_MAX_SIZE:
+                _dataTypeCache.popitem(last=False)
+
+    return dataTypeLookup
+
+
 def _getLiveDbKeyDatatypeDict(
     ormSession, liveDbModelSet: LiveDbModelSet, liveDbKeys: List[str]
 ) -> Dict[str, int]:
@@ -159,13 +249,12 @@ def _getLiveDbKeyDatatypeDict(
     Return an array of items representing the display values from the LiveDB.
 
     :param ormSession: The SQLAlchemy orm session from the calling code.
-    :param liveDbModelSet: The name of the model set to get the keys for
+    :param liveDbModelSet: The model set to get the keys for
     :param liveDbKeys: An array of LiveDb Keys.
 
     :returns: An array of tuples.
     """
     liveDbTable = LiveDbItem.__table__
-    modelTable = LiveDbModelSet.__table__
 
     if not liveDbKeys:
         return {}
@@ -173,10 +262,7 @@ def _getLiveDbKeyDatatypeDict(
     liveDbKeys = list(set(liveDbKeys))  # Remove duplicates if any exist.
     stmt = (
         select(liveDbTable.c.key, liveDbTable.c.dataType)
-        .select_from(
-            liveDbTable.join(modelTable, liveDbTable.c.modelSetId == modelTable.c.id)
-        )
-        .where(modelTable.c.name == liveDbModelSet.name)
+        .where(liveDbTable.c.modelSetId == liveDbModelSet.id)
         .where(liveDbTable.c.key.in_(liveDbKeys))
     )
 
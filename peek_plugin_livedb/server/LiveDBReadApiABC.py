@@ -1,9 +1,13 @@
 from abc import ABCMeta, abstractmethod
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 from reactivex.subject import Subject
 from twisted.internet.defer import Deferred
 
+from peek_plugin_livedb.tuples.LiveDbDisplayValueCodec import (
+    BULK_LOAD_FORMAT_PAYLOAD,
+)
+
 
 class LiveDBReadApiABC(metaclass=ABCMeta):
     @abstractmethod
@@ -45,6 +49,9 @@ class LiveDBReadApiABC(metaclass=ABCMeta):
 
         Return an observable that fires when livedb items are added
 
+        Large imports emit the new items as several lists, see the
+        "Import Additions Chunk Size" setting.
+
         :param modelSetName: The name of the model set for the live db
 
         :return: An observable that fires when keys are removed from the live db
@@ -71,6 +78,7 @@ class LiveDBReadApiABC(metaclass=ABCMeta):
         modelSetName: str,
         keyList: Optional[List[str]] = None,
         chunkSize: int = 2500,
+        chunkFormat: str = BULK_LOAD_FORMAT_PAYLOAD,
     ) -> Deferred:
         """Live DB Tuples
 
@@ -80,12 +88,25 @@ class LiveDBReadApiABC(metaclass=ABCMeta):
         :param chunkSize: The number of items to return for each chunk
         :param modelSetName:  The name of the model set for the live db
         :param keyList:  An optional list of keys that the data is required for
+        :param chunkFormat: How the chunks are encoded, one of the BULK_LOAD_FORMAT
+            constants in LiveDbDisplayValueCodec. The default is a vortex payload of
+            LiveDbDisplayValueTuples, BULK_LOAD_FORMAT_ROWS is much cheaper to
+            decode for large loads. BULK_LOAD_FORMAT_COLUMNS decodes to parallel
+            arrays, for consumers that build their own index of the values.
 
         :return: A deferred that fires with a list of tuples
         :rtype: C{LiveDbDisplayValueTuple}
 
         This is served up in chunks to prevent ballooning the memory usage.
 
+        The chunks are paged by the item id, so every chunk costs the same, no matter
+        how far into the load it is. After the last chunk, the generator yields one
+        empty result, then stops.
+
+        Each chunk starts where the last one ended, so the deferred of a chunk must
+        have fired before the next is requested, the generator raises an exception
+        otherwise.
+
         Here is an example of how to use this method
 
         ::
@@ -106,6 +127,27 @@ class LiveDBReadApiABC(metaclass=ABCMeta):
 
 
 
+        """
+
+    @abstractmethod
+    def getLiveDbDisplayValues(
+        self, modelSetName: str, liveDbKeys: List[str]
+    ) -> Deferred:
+        """Get Live DB Display Values
+
+        Return the current values for a list of keys.
+
+        These are served from memory once the logic service has loaded the LiveDB,
+        until then they are read from the database.
+
+        Keys that don't exist in the LiveDB are not returned.
+
+        :param modelSetName:  The name of the model set for the live db
+        :param liveDbKeys: A list of the livedb keys to get the values for
+
+        :return: A deferred that fires with a list of tuples
+        :rtype: List[LiveDbDisplayValueTuple]
+
         """
 
     @abstractmethod
@@ -122,6 +164,25 @@ class LiveDBReadApiABC(metaclass=ABCMeta):
 
         """
 
+    @abstractmethod
+    def updateLatencyMetrics(self) -> Dict[str, Dict]:
+        """Update Latency Metrics
+
+        Return histograms of how long raw value updates take, from when
+        C{updateRawValues} received them, to:
+
+        * queueWait - a worker starting to apply them.
+        * workerApply - the worker committing them, this is per block.
+        * notify - their display values being published, this is end to end.
+
+        Each histogram is a dict of count, sumMs, p50Ms, p99Ms and buckets, the
+        buckets are cumulative [upperBoundMs, count] pairs, the last bound is None.
+        The percentiles of the last minute are under "window".
+
+        :return: A dict of histogram name to histogram, that can be dumped as JSON
+
+        """
+
     @abstractmethod
     def displayValueUpdatesObservable(self, modelSetName: str) -> Subject:
         """Display Value Update Observable
@@ -129,6 +190,9 @@ class LiveDBReadApiABC(metaclass=ABCMeta):
         Return an observable that fires with lists of C{LiveDbDisplayValueTuple} tuples
         containing updates to live db values.
 
+        The values are published after the worker has written them to the database,
+        one list for each block of queued raw values the worker processes.
+
         :param modelSetName:  The name of the model set for the live db
 
         :return: An observable that fires when values are updated in the livedb
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List
 
 from abc import ABCMeta, abstractmethod
 from twisted.internet.defer import Deferred
@@ -29,6 +29,24 @@ class LiveDBWriteApiABC(metaclass=ABCMeta):
 
         """
 
+    @abstractmethod
+    def setSuppressUnchangedRawValues(
+        self, modelSetName: str, enabled: bool
+    ) -> Deferred:
+        """Set Suppress Unchanged Raw Values
+
+        When enabled, updateRawValues drops updates that don't change the stored
+        raw value of an item, they are not queued, written or observed.
+
+        This is stored against the model set, it's disabled by default.
+
+        :param modelSetName:  The name of the model set for the live db
+        :param enabled: True to drop unchanged raw value updates
+
+        :return: A deferred that fires when the setting is stored.
+
+        """
+
     @abstractmethod
     def importLiveDbItems(
         self, modelSetName: str, newItems: List[ImportLiveDbItemTuple]
@@ -37,7 +55,8 @@ class LiveDBWriteApiABC(metaclass=ABCMeta):
 
         Create new Live DB Items with Raw + Display values
 
-        If an item already exists, it's value is update.
+        If an item already exists, it's dataType and importHash are updated, it's
+        Raw + Display values are left as they are.
 
         :param modelSetName:  The name of the model set for the live db
         :param newItems: A list of tuples containing the value updates
@@ -47,6 +66,68 @@ class LiveDBWriteApiABC(metaclass=ABCMeta):
 
         """
 
+    @abstractmethod
+    def importLiveDbItemGroups(
+        self,
+        modelSetName: str,
+        newItemsByImportHash: Dict[str, List[ImportLiveDbItemTuple]],
+    ) -> Deferred:
+        """Import LiveDB Item Groups
+
+        Import whole groups of Live DB Items, a group is all the items with the same
+        importHash.
+
+        Groups that haven't changed since they were last imported with this method
+        are skipped. For the other groups, new items are inserted, existing items
+        are updated as C{importLiveDbItems} does, and the items that are no longer
+        in the group are deleted.
+
+        Each item must have the importHash of its group, and be in only one group.
+
+        :param modelSetName:  The name of the model set for the live db
+        :param newItemsByImportHash: All the items of each group, by importHash
+
+        :return: A deferred that fires with the number of groups imported.
+        :rtype: int
+
+        """
+
+    @abstractmethod
+    def deleteLiveDbItems(self, modelSetName: str, liveDbKeys: List[str]) -> Deferred:
+        """Delete LiveDB Items
+
+        Delete the Live DB Items with these keys, and any raw value updates that are
+        still queued for them.
+
+        The items are deleted in chunks, the keys deleted by each chunk are emitted
+        on C{LiveDBReadApiABC.itemDeletionsObservable}.
+
+        :param modelSetName:  The name of the model set for the live db
+        :param liveDbKeys: A list of the livedb keys to delete
+
+        :return: A deferred that fires with the number of items deleted.
+        :rtype: int
+
+        """
+
+    @abstractmethod
+    def deleteLiveDbItemsByImportHash(
+        self, modelSetName: str, importHash: str
+    ) -> Deferred:
+        """Delete LiveDB Items By Import Hash
+
+        Delete the Live DB Items that were imported with this importHash.
+
+        This works the same as C{deleteLiveDbItems}.
+
+        :param modelSetName:  The name of the model set for the live db
+        :param importHash: The importHash of the items to delete
+
+        :return: A deferred that fires with the number of items deleted.
+        :rtype: int
+
+        """
+
     @abstractmethod
     def prioritiseLiveDbValueAcquisition(
         self, modelSetName: str, liveDbKeys: List[str]
@@ -0,0 +1,185 @@
+"""LiveDB Display Value Codec
+
+A compact encoding for lists of LiveDbDisplayValueTuple values.
+
+A vortex Payload encodes each tuple as an object with its type and field names, and
+decoding it constructs each tuple field by field. These tuples always have the same
+four fields, so this codec encodes them as [key, dataType, rawValue, displayValue]
+rows in one JSON array, which the json module decodes in C.
+
+The encoding is zlib compressed and base64 encoded, the same as a vortex encoded
+payload, so it can be sent anywhere a payload can.
+
+The columns encoding goes further, it holds parallel arrays of the keys, dataTypes,
+rawValues and displayValues, and decodes to LiveDbDisplayValueColumns, with the
+dataTypes in an array.array. No list or tuple is allocated per row.
+
+"""
+import json
+import struct
+import sys
+import zlib
+from array import array
+from base64 import b64decode, b64encode
+from typing import Dict, List, Sequence
+
+from peek_plugin_livedb.tuples.LiveDbDisplayValueTuple import LiveDbDisplayValueTuple
+
+#: bulkLoadDeferredGenerator chunks are vortex encoded payloads of
+#: LiveDbDisplayValueTuples, decode them with Payload().fromEncodedPayload()
+BULK_LOAD_FORMAT_PAYLOAD = "payload"
+
+#: bulkLoadDeferredGenerator chunks are encoded with encodeDisplayValueRows, decode
+#: them with decodeDisplayValueRows or decodeDisplayValueTuples
+BULK_LOAD_FORMAT_ROWS = "rows"
+
+#: bulkLoadDeferredGenerator chunks are encoded with encodeDisplayValueColumns,
+#: decode them with decodeDisplayValueColumns
+BULK_LOAD_FORMAT_COLUMNS = "columns"
+
+BULK_LOAD_FORMATS = (
+    BULK_LOAD_FORMAT_PAYLOAD,
+    BULK_LOAD_FORMAT_ROWS,
+    BULK_LOAD_FORMAT_COLUMNS,
+)
+
+#: Compression is cheap at level 1, and the keys compress well at any level
+COMPRESSION_LEVEL = 1
+
+# The columns header is the array typecode of the dataTypes, and the row count
+_COLUMNS_HEADER = struct.Struct("<cI")
+
+
+def encodeDisplayValueRows(rows: Sequence[Sequence]) -> bytes:
+    """Encode Display Value Rows
+
+    :param rows: [key, dataType, rawValue, displayValue] lists or tuples
+    :return: The encoded rows
+    """
+    data = json.dumps(rows, separators=(",", ":")).encode()
+    return b64encode(zlib.compress(data, COMPRESSION_LEVEL))
+
+
+def decodeDisplayValueRows(encodedRows: bytes) -> List[list]:
+    """Decode Display Value Rows
+
+    This is the cheapest way to read the values, no tuples are constructed.
+
+    :param encodedRows: Rows encoded with encodeDisplayValueRows
+    :return: [key, dataType, rawValue, displayValue] lists
+    """
+    return json.loads(zlib.decompress(b64decode(encodedRows)))
+
+
+class LiveDbDisplayValueColumns:
+    """LiveDB Display Value Columns
+
+    The display values of a chunk, as parallel arrays, row i is keys[i],
+    dataTypes[i], rawValues[i] and displayValues[i].
+
+    """
+
+    __slots__ = ("keys", "dataTypes", "rawValues", "displayValues")
+
+    def __init__(
+        self,
+        keys: List[str],
+        dataTypes: array,
+        rawValues: List[str],
+        displayValues: List[str],
+    ):
+        self.keys = keys
+        self.dataTypes = dataTypes
+        self.rawValues = rawValues
+        self.displayValues = displayValues
+
+    def __len__(self):
+        return len(self.keys)
+
+    def indexByKey(self) -> Dict[str, int]:
+        """Index By Key
+
+        :return: The row index of each key
+        """
+        return dict(zip(self.keys, range(len(self.keys))))
+
+
+def encodeDisplayValueColumns(rows: Sequence[Sequence]) -> bytes:
+    """Encode Display Value Columns
+
+    The dataTypes are stored one byte each, or four if one is out of byte range.
+
+    :param rows: [key, dataType, rawValue, displayValue] lists or tuples
+    :return: The encoded columns
+    """
+    if rows:
+        keys, dataTypes, rawValues, displayValues = zip(*rows)
+    else:
+        keys, dataTypes, rawValues, displayValues = (), (), (), ()
+
+    try:
+        dataTypes = array("B", dataTypes)
+    except OverflowError:
+        dataTypes = array("i", dataTypes)
+
+    # The dataTypes are stored little endian
+    if sys.byteorder == "big":
+        dataTypes.byteswap()
+
+    values = json.dumps([keys, rawValues, displayValues], separators=(",", ":"))
+
+    data = b"".join(
+        [
+            _COLUMNS_HEADER.pack(dataTypes.typecode.encode(), len(keys)),
+            dataTypes.tobytes(),
+            values.encode(),
+        ]
+    )
+    return b64encode(zlib.compress(data, COMPRESSION_LEVEL))
+
+
+def decodeDisplayValueColumns(encodedColumns: bytes) -> LiveDbDisplayValueColumns:
+    """Decode Display Value Columns
+
+    :param encodedColumns: Columns encoded with encodeDisplayValueColumns
+    :return: The columns
+    """
+    data = zlib.decompress(b64decode(encodedColumns))
+
+    typecode, count = _COLUMNS_HEADER.unpack_from(data)
+    offset = _COLUMNS_HEADER.size
+
+    dataTypes = array(typecode.decode())
+    end = offset + count * dataTypes.itemsize
+    dataTypes.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        dataTypes.byteswap()
+
+    keys, rawValues, displayValues = json.loads(data[end:])
+    return LiveDbDisplayValueColumns(keys, dataTypes, rawValues, displayValues)
+
+
+def encodeDisplayValueTuples(tuples: List[LiveDbDisplayValueTuple]) -> bytes:
+    """Encode Display Value Tuples
+
+    :return: The tuples encoded as rows, see encodeDisplayValueRows
+    """
+    return encodeDisplayValueRows(
+        [[t.key, t.dataType, t.rawValue, t.displayValue] for t in tuples]
+    )
+
+
+def decodeDisplayValueTuples(encodedRows: bytes) -> List[LiveDbDisplayValueTuple]:
+    """Decode Display Value Tuples
+
+    :param encodedRows: Rows encoded with encodeDisplayValueRows
+    :return: A LiveDbDisplayValueTuple for each row
+    """
+    return [
+        LiveDbDisplayValueTuple(
+            key=key, dataType=dataType, rawValue=rawValue, displayValue=displayValue
+        )
+        for key, dataType, rawValue, displayValue in decodeDisplayValueRows(
+            encodedRows
+        )
+    ]